@@ -0,0 +1,87 @@
+"""Read catalog pages from a replica, everything else from the primary.
+
+``ReplicaMiddleware`` marks GET requests for the read-only catalog pages
+(home, the catalog and product detail); while such a request runs,
+``PrimaryReplicaRouter`` reads products and facets from the ``replica``
+alias. Users, sessions, carts, checkout, farmer product CRUD and every write
+stay on ``default``.
+
+The replica lags the primary by up to one ``manage.py sync_replica`` run, so
+a session that has just written (any POST that did not fail) is pinned to
+the primary for ``REPLICA_STICKY_SECONDS`` and sees its own changes.
+"""
+import contextlib
+import contextvars
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import Resolver404, resolve
+
+REPLICA = 'replica'
+REPLICA_URL_NAMES = {'home', 'home_feed', 'products', 'view_products', 'product_detail'}
+# Only catalog data may be read stale; accounts and sessions never are
+REPLICA_APPS = {'products'}
+STICKY_SESSION_KEY = '_primary_until'
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+@contextlib.contextmanager
+def replica_reads():
+    """Route catalog reads to the replica inside this block."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and model._meta.app_label in REPLICA_APPS:
+            return REPLICA
+        # Explicit, or Django would follow an instance hint loaded from the replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica is a copy of the primary, schema included
+        return db != REPLICA
+
+
+class ReplicaMiddleware:
+    """Must come after SessionMiddleware."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REPLICA_READS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            response = self.get_response(request)
+            if response.status_code < 400:
+                # Read your own writes until the replica has caught up
+                request.session[STICKY_SESSION_KEY] = time.time() + settings.REPLICA_STICKY_SECONDS
+            return response
+        if not self._may_use_replica(request):
+            return self.get_response(request)
+        with replica_reads():
+            return self.get_response(request)
+
+    def _may_use_replica(self, request):
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            return False
+        if url_name not in REPLICA_URL_NAMES:
+            return False
+        return request.session.get(STICKY_SESSION_KEY, 0) < time.time()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -41,15 +42,21 @@ INSTALLED_APPS = [
     'user',
     'products',
     'payment',
+    'jobs',
+    'perf',
 ]
 
 MIDDLEWARE = [
+    'perf.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'Krishik_Bazar.routers.ReplicaMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'perf.profiler.ProfilerMiddleware',
+    'products.pagecache.PageCacheMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -76,13 +83,54 @@ WSGI_APPLICATION = 'Krishik_Bazar.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Run on every new SQLite connection. WAL lets readers carry on while one
+# writer commits; busy_timeout makes a second writer wait instead of failing
+# with "database is locked". See `manage.py sqlite_checkpoint` for upkeep.
+SQLITE_PRAGMAS = (
+    # First, so the pragmas below also wait for locks
+    'PRAGMA busy_timeout = 20000',
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',  # durable at every checkpoint, safe from corruption in WAL mode
+    'PRAGMA mmap_size = 268435456',  # 256 MiB
+    'PRAGMA cache_size = -65536',  # 64 MiB per connection
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA journal_size_limit = 67108864',  # truncate the WAL back to 64 MiB after checkpoints
+)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': '; '.join(SQLITE_PRAGMAS),
+            # Take the write lock when a transaction starts, so two writers queue on
+            # busy_timeout instead of deadlocking when both try to upgrade a read lock
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # File-backed test database so concurrency tests can open several connections
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# Optional read replica for the catalog pages, see Krishik_Bazar/routers.py.
+# Point REPLICA_DATABASE at a second SQLite file and keep it current with
+# `manage.py sync_replica --interval 10`.
+if os.environ.get('REPLICA_DATABASE'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / os.environ['REPLICA_DATABASE'],
+        'OPTIONS': {
+            # No journal_mode: the replica keeps whatever the primary's backup gives it
+            'init_command': '; '.join([p for p in SQLITE_PRAGMAS if 'journal_mode' not in p] + ['PRAGMA query_only = ON']),
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['Krishik_Bazar.routers.PrimaryReplicaRouter']
+REPLICA_READS = 'replica' in DATABASES
+REPLICA_STICKY_SECONDS = 30  # keep a session on the primary this long after a write
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -132,4 +180,80 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'user.User'
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Shared by every worker process: Redis when REDIS_URL is set (configure it with
+# maxmemory-policy allkeys-lru), otherwise files on local disk. Both expire
+# entries after TIMEOUT; the file cache also culls once it holds MAX_ENTRIES.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'KEY_PREFIX': 'krishik',
+            'TIMEOUT': 3600,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(tempfile.gettempdir(), 'krishik_bazar_cache'),
+            'TIMEOUT': 3600,
+            'OPTIONS': {'MAX_ENTRIES': 5000, 'CULL_FREQUENCY': 4},
+        }
+    }
+
+# Sessions are read from the cache, so serving a cached page needs no query
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Rendered home/catalog/detail pages, see products/pagecache.py
+PAGE_CACHE_TIMEOUT = 300
+# Catalog category counts and price histogram, see products/facets.py
+FACET_CACHE_TIMEOUT = 600
+# Compare-and-swap attempts for a farmer's stock edit, see products/stock.py
+STOCK_UPDATE_ATTEMPTS = 3
+# How long a cart keeps its reserved units, see products/holds.py
+STOCK_HOLD_SECONDS = 15 * 60
+
+STORAGES = {
+    # Uploads are stored once per distinct content, see products/storage.py
+    'default': {
+        'BACKEND': 'products.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+# Background jobs, see jobs/queue.py. Run workers with `manage.py run_jobs`;
+# JOBS_EAGER runs every job inline as soon as it is queued.
+JOBS_EAGER = False
+JOBS_POOL = 'thread'  # or 'process'
+JOBS_CONCURRENCY = 4
+JOBS_POLL_INTERVAL = 1.0
+JOBS_LEASE_SECONDS = 300
+
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'Krishik Bazar <no-reply@krishikbazar.local>'
+
+# Server-Timing header and a JSON log line per request, see perf/middleware.py.
+# Off by default; when off the middleware is dropped from the stack at startup.
+REQUEST_TIMING = os.environ.get('REQUEST_TIMING') == '1'
+REQUEST_TIMING_SLOW_MS = 500
+REQUEST_TIMING_SLOW_SAMPLE_RATE = 0.1  # share of slow requests logged with every query
+
+# Staff can profile one request with ?profile= or an X-Profile header
+# (cprofile or sample), see perf/profiler.py
+PROFILE_DIR = os.path.join(tempfile.gettempdir(), 'krishik_bazar_profiles')
+PROFILE_SAMPLE_INTERVAL = 0.001
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'perf.requests': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
@@ -0,0 +1,19 @@
+"""
+Settings for the test suite; ``manage.py test`` uses them unless told
+otherwise with --settings or DJANGO_SETTINGS_MODULE.
+"""
+from .settings import *  # noqa: F401,F403
+
+# A private in-memory cache, so runs never see each other's pages
+CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# A replica alias mirroring the test database. Routing to it stays off except
+# in the tests that turn REPLICA_READS on, see Krishik_Bazar/routers.py.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'OPTIONS': {
+        'init_command': '; '.join([p for p in SQLITE_PRAGMAS if 'journal_mode' not in p] + ['PRAGMA query_only = ON']),
+    },
+    'TEST': {'MIRROR': 'default'},
+}
+REPLICA_READS = False
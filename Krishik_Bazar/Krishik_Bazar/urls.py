@@ -26,6 +26,7 @@ urlpatterns = [
     # Include all product URLs from the 'products' app
     path('products/', include('products.urls')),
     path('payment/', include('payment.urls')),
+    path('perf/', include('perf.urls')),
 ]
 
 # This is only needed when running in development mode
@@ -0,0 +1,27 @@
+import logging
+import signal
+
+from django.core.management.base import BaseCommand
+
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the job table on a thread or process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, help="Number of jobs to run at once (default: JOBS_CONCURRENCY).")
+        parser.add_argument('--pool', choices=('thread', 'process'), help="Pool type (default: JOBS_POOL).")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty instead of polling.")
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO if options['verbosity'] > 1 else logging.WARNING)
+        worker = Worker(concurrency=options['concurrency'], pool=options['pool'])
+
+        # Finish the jobs in flight on Ctrl-C / SIGTERM instead of abandoning them mid-run
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: worker.stop())
+
+        self.stdout.write(f"Worker {worker.name} running {worker.concurrency} {worker.pool} slot(s)")
+        processed = worker.run(burst=options['burst'])
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} job(s)."))
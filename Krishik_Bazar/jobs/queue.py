@@ -0,0 +1,119 @@
+"""A small durable job queue stored in the ``jobs_job`` table.
+
+Apps register work with the ``@job`` decorator in their ``jobs.py`` and hand it
+off with ``enqueue`` (or ``func.delay(...)``). The job row is written in the
+caller's transaction, so it is only picked up once the triggering change has
+committed, and it survives restarts until a worker (``manage.py run_jobs``)
+marks it done. With ``JOBS_EAGER = True`` jobs run inline as soon as they
+are queued instead, which is handy in development and tests.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class UnknownJob(LookupError):
+    pass
+
+
+def job(func):
+    """Register ``func`` as a job, named after its module and function."""
+    name = f'{func.__module__}.{func.__name__}'
+    _registry[name] = func
+    func.job_name = name
+    func.delay = lambda **payload: enqueue(name, **payload)
+    return func
+
+
+def get_job(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise UnknownJob(name)
+
+
+def enqueue(name, /, delay=None, max_attempts=3, unique=False, **payload):
+    """Queue ``name`` to run with ``payload`` as keyword arguments; returns the Job.
+
+    With ``unique``, an identical job that is still waiting to run is
+    returned instead of queueing another.
+    """
+    if callable(name):
+        name = name.job_name
+    get_job(name)
+    if unique:
+        waiting = Job.objects.filter(name=name, payload=payload, status='queued').first()
+        if waiting is not None:
+            return waiting
+    run_after = timezone.now() + (delay or timedelta())
+    queued = Job.objects.create(name=name, payload=payload, run_after=run_after, max_attempts=max_attempts)
+    if getattr(settings, 'JOBS_EAGER', False):
+        run_job(queued.pk, worker='eager')
+    return queued
+
+
+def claim_jobs(worker, limit):
+    """Atomically take up to ``limit`` runnable jobs for ``worker`` and return their ids."""
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(status='queued', run_after__lte=now)
+        .order_by('run_after', 'id').values_list('id', flat=True)[:limit]
+    )
+    claimed = []
+    for job_id in candidates:
+        # Conditional update, so two workers racing for one job cannot both win it
+        if Job.objects.filter(pk=job_id, status='queued').update(
+            status='running', locked_at=now, locked_by=worker, attempts=F('attempts') + 1
+        ):
+            claimed.append(job_id)
+    return claimed
+
+
+def requeue_stale_jobs(lease_seconds):
+    """Return jobs whose worker died mid-run (lease expired) to the queue; returns how many.
+
+    A job that has used up its attempts is marked failed instead, so one that
+    kills its worker every time is not retried forever.
+    """
+    expired = Job.objects.filter(
+        status='running', locked_at__lt=timezone.now() - timedelta(seconds=lease_seconds),
+    )
+    expired.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', locked_at=None, last_error='Lease expired on the last attempt; the worker died running it.',
+    )
+    return expired.update(status='queued', locked_at=None, locked_by='')
+
+
+def run_job(job_id, worker='inline'):
+    """Run one claimed (or, for eager use, queued) job and record the outcome."""
+    current = Job.objects.get(pk=job_id)
+    if current.status == 'queued':
+        Job.objects.filter(pk=job_id).update(
+            status='running', locked_at=timezone.now(), locked_by=worker, attempts=F('attempts') + 1
+        )
+        current.attempts += 1
+    try:
+        get_job(current.name)(**current.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception("Job %s (%s) failed on attempt %s", current.pk, current.name, current.attempts)
+        if current.attempts < current.max_attempts:
+            backoff = timedelta(seconds=2 ** current.attempts)
+            Job.objects.filter(pk=job_id).update(
+                status='queued', run_after=timezone.now() + backoff, locked_at=None, locked_by='', last_error=error
+            )
+        else:
+            Job.objects.filter(pk=job_id).update(status='failed', locked_at=None, last_error=error)
+        return False
+    Job.objects.filter(pk=job_id).update(status='done', locked_at=None, last_error='')
+    return True
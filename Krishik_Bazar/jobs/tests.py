@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from .models import Job
+from .queue import UnknownJob, claim_jobs, enqueue, job, requeue_stale_jobs, run_job
+from .worker import Worker
+
+calls = []
+
+
+@job
+def record(value):
+    calls.append(value)
+
+
+@job
+def explode():
+    raise RuntimeError('boom')
+
+
+class QueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_waits_for_a_worker(self):
+        queued = record.delay(value=1)
+
+        self.assertEqual((queued.status, queued.payload), ('queued', {'value': 1}))
+        self.assertEqual(calls, [])
+        self.assertTrue(run_job(queued.pk))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('done', 1))
+        self.assertEqual(calls, [1])
+
+    def test_eager_runs_inline(self):
+        with self.settings(JOBS_EAGER=True):
+            queued = enqueue(record, value=2)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'done')
+        self.assertEqual(calls, [2])
+
+    def test_unknown_job_is_rejected(self):
+        with self.assertRaises(UnknownJob):
+            enqueue('nope.missing')
+
+    def test_claim_skips_delayed_and_claimed_jobs(self):
+        ready = record.delay(value=1)
+        enqueue(record, delay=timedelta(minutes=5), value=2)
+
+        self.assertEqual(claim_jobs('a', 10), [ready.pk])
+        self.assertEqual(claim_jobs('b', 10), [])
+        ready.refresh_from_db()
+        self.assertEqual((ready.status, ready.locked_by, ready.attempts), ('running', 'a', 1))
+
+    def test_failures_back_off_then_give_up(self):
+        queued = enqueue(explode, max_attempts=2)
+
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            self.assertFalse(run_job(queued.pk))
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'queued')
+        self.assertGreater(queued.run_after, timezone.now())
+        self.assertIn('RuntimeError: boom', queued.last_error)
+
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            run_job(queued.pk)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('failed', 2))
+
+    def test_expired_lease_is_requeued(self):
+        queued = record.delay(value=1)
+        claim_jobs('dead-worker', 1)
+        Job.objects.filter(pk=queued.pk).update(locked_at=timezone.now() - timedelta(minutes=10))
+
+        self.assertEqual(requeue_stale_jobs(lease_seconds=60), 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.locked_by), ('queued', ''))
+
+    def test_expired_lease_on_the_last_attempt_fails(self):
+        queued = enqueue(record, max_attempts=1, value=1)
+        claim_jobs('dead-worker', 1)
+        Job.objects.filter(pk=queued.pk).update(locked_at=timezone.now() - timedelta(minutes=10))
+
+        self.assertEqual(requeue_stale_jobs(lease_seconds=60), 0)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'failed')
+        self.assertIn('Lease expired', queued.last_error)
+        self.assertEqual(claim_jobs('worker', 1), [])
+
+    def test_unique_jobs_are_queued_once(self):
+        first = enqueue(record, unique=True, value=1)
+        self.assertEqual(enqueue(record, unique=True, value=1), first)
+        self.assertNotEqual(enqueue(record, unique=True, value=2), first)
+
+        claim_jobs('worker', 1)
+        # The first one is running and may already have read what changed since
+        self.assertNotEqual(enqueue(record, unique=True, value=1), first)
+        self.assertEqual(Job.objects.count(), 3)
+
+class WorkerTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Needs a file-backed test database shared between threads.')
+        calls.clear()
+
+    def test_burst_drains_the_queue(self):
+        for value in range(10):
+            record.delay(value=value)
+
+        processed = Worker(concurrency=3, pool='thread', poll_interval=0.05).run(burst=True)
+
+        self.assertEqual(processed, 10)
+        self.assertEqual(sorted(calls), list(range(10)))
+        self.assertFalse(Job.objects.exclude(status='done').exists())
@@ -0,0 +1,78 @@
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from .queue import claim_jobs, requeue_stale_jobs, run_job
+
+logger = logging.getLogger(__name__)
+
+
+def _execute(job_id, worker):
+    # Runs on a pool thread or in a pool process, each with its own DB connection
+    close_old_connections()
+    try:
+        return run_job(job_id, worker=worker)
+    finally:
+        close_old_connections()
+
+
+def _init_process():
+    # Forked children must not reuse the parent's SQLite/DB handles
+    for conn in connections.all(initialized_only=True):
+        conn.inc_thread_sharing()
+        conn.close()
+        conn.dec_thread_sharing()
+
+
+class Worker:
+    """Polls the job table and runs jobs on a thread or process pool."""
+
+    def __init__(self, concurrency=None, pool=None, poll_interval=None, lease_seconds=None):
+        self.concurrency = concurrency or getattr(settings, 'JOBS_CONCURRENCY', 4)
+        self.pool = pool or getattr(settings, 'JOBS_POOL', 'thread')
+        self.poll_interval = poll_interval or getattr(settings, 'JOBS_POLL_INTERVAL', 1.0)
+        self.lease_seconds = lease_seconds or getattr(settings, 'JOBS_LEASE_SECONDS', 300)
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+
+    def _executor(self):
+        if self.pool == 'process':
+            connections.close_all()
+            return ProcessPoolExecutor(max_workers=self.concurrency, initializer=_init_process)
+        return ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='job')
+
+    def stop(self):
+        self.stopping.set()
+
+    def run(self, burst=False):
+        """Process jobs until stopped; with ``burst`` return once the queue is drained."""
+        processed = 0
+        in_flight = set()
+        with self._executor() as executor:
+            while not self.stopping.is_set():
+                requeued = requeue_stale_jobs(self.lease_seconds)
+                if requeued:
+                    logger.warning("Requeued %s job(s) with expired leases", requeued)
+
+                for job_id in claim_jobs(self.name, self.concurrency - len(in_flight)):
+                    in_flight.add(executor.submit(_execute, job_id, self.name))
+
+                if not in_flight:
+                    if burst:
+                        break
+                    self.stopping.wait(self.poll_interval)
+                    continue
+
+                done, in_flight = wait(in_flight, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    processed += 1
+                    if future.exception():
+                        logger.error("Job execution crashed", exc_info=future.exception())
+            wait(in_flight)
+        close_old_connections()
+        return processed
@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Krishik_Bazar.settings')
+    # The test suite runs on its own settings, see Krishik_Bazar/test_settings.py
+    test = sys.argv[1:2] == ['test']
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Krishik_Bazar.test_settings' if test else 'Krishik_Bazar.settings')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
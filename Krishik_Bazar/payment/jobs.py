@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import send_mass_mail
+
+from jobs.queue import job
+from .models import Order
+
+STATUS_SUBJECTS = {
+    'pending': "Order #{id} placed",
+    'cancelled': "Order #{id} cancelled",
+    'completed': "Order #{id} completed",
+}
+
+
+@job
+def notify_order_status(order_id):
+    """Email the customer, and each farmer with products in the order, about its new status."""
+    order = Order.objects.with_items().select_related('user').filter(pk=order_id).first()
+    if order is None or order.status not in STATUS_SUBJECTS:
+        return
+    subject = STATUS_SUBJECTS[order.status].format(id=order.id)
+    lines = '\n'.join(f"- {item.product.name} x {item.quantity} @ {item.price}" for item in order.items.all())
+
+    messages = []
+    if order.user.email:
+        messages.append((subject, f"Hi {order.user.username},\n\n{lines}\n\nTotal: {order.total_price}", settings.DEFAULT_FROM_EMAIL, [order.user.email]))
+    farmers = {}
+    for item in order.items.all():
+        farmers.setdefault(item.product.user_id, []).append(item)
+    # One query for every seller's address instead of one per line
+    for farmer in get_user_model().objects.filter(id__in=farmers).exclude(email=''):
+        own = '\n'.join(f"- {item.product.name} x {item.quantity}" for item in farmers[farmer.id])
+        messages.append((subject, f"Hi {farmer.username},\n\n{own}", settings.DEFAULT_FROM_EMAIL, [farmer.email]))
+    send_mass_mail(messages, fail_silently=False)
@@ -0,0 +1,30 @@
+from django.db import migrations
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_total_price(apps, schema_editor):
+    # Totals used to be recomputed by the cart pages; orders nobody reopened may be stale.
+    # The same single UPDATE as Order.update_total_price, for every order at once.
+    Order = apps.get_model('payment', 'Order')
+    OrderItem = apps.get_model('payment', 'OrderItem')
+    money = DecimalField(max_digits=10, decimal_places=2)
+    line_totals = (
+        OrderItem.objects.filter(order=OuterRef('pk')).values('order')
+        .annotate(total=Sum(F('quantity') * F('price'), output_field=money))
+        .values('total')
+    )
+    Order.objects.using(schema_editor.connection.alias).update(
+        total_price=Coalesce(Subquery(line_totals), Value(0), output_field=money)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0003_order_order_user_status_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_total_price, migrations.RunPython.noop),
+    ]
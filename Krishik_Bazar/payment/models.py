@@ -1,7 +1,32 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
 from products.models import Product
+from products.stock import return_stock, take_stock
+from products.pagecache import purge_page_cache
 from django.conf import settings  
+
+class InsufficientStock(Exception):
+    """Raised when an order asks for more of a product than is left in stock."""
+
+    def __init__(self, shortfalls):
+        # (order item, units available) for every line that cannot be filled
+        self.shortfalls = shortfalls
+        super().__init__(', '.join(item.product.name for item, _ in shortfalls))
+
+class OrderQuerySet(models.QuerySet):
+    def with_items(self):
+        """Prefetch line items and their products, so rendering an order costs the same for any line count."""
+        return self.prefetch_related(
+            models.Prefetch('items', queryset=OrderItem.objects.select_related('product').order_by('id'))
+        )
+
+    def cart_for(self, user):
+        """Return the user's open cart with its items loaded, or None."""
+        return self.with_items().filter(user=user, status='cart').first()
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('cart', 'Cart'),
@@ -16,17 +41,65 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # The user's cart lookup on every cart, add-to-cart and checkout request
+            models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+        ]
+
     def update_total_price(self):
-        """Update the total price of the order based on its items."""
-        total = sum(item.quantity * item.price for item in self.items.all())
-        self.total_price = total
-        self.save(update_fields=['total_price'])
+        """Recompute the total price from the order's items in a single DB-side UPDATE.
+
+        Called automatically whenever an OrderItem is saved or deleted, so
+        pages that only display an order never need to write it.
+        """
+        line_totals = (
+            OrderItem.objects.filter(order=OuterRef('pk')).values('order')
+            .annotate(total=Sum(F('quantity') * F('price'), output_field=DecimalField(max_digits=10, decimal_places=2)))
+            .values('total')
+        )
+        Order.objects.filter(pk=self.pk).update(
+            total_price=Coalesce(Subquery(line_totals), Value(0), output_field=DecimalField(max_digits=10, decimal_places=2))
+        )
     
+    def place(self):
+        """Take stock for every line and mark the order pending, as one atomic unit.
+
+        The cart is claimed first (``status = 'pending' WHERE status = 'cart'``),
+        so a checkout submitted twice takes stock once; the call that loses
+        returns False and changes nothing. All lines are then decremented by a
+        single conditional UPDATE (``stock = stock - qty WHERE stock - held >=
+        qty``, ``held`` being what other carts reserved), so concurrent
+        checkouts can never oversell. The cart's own holds are released. If
+        any line is short nothing is changed and InsufficientStock is raised.
+        """
+        with transaction.atomic():
+            if not Order.objects.filter(pk=self.pk, status='cart').update(status='pending', updated_at=timezone.now()):
+                return False
+            # Read under the transaction, so the lines are the ones being paid for
+            items = list(OrderItem.objects.filter(order=self).select_related('product'))
+            requested = {}
+            for item in items:
+                requested[item.product_id] = requested.get(item.product_id, 0) + item.quantity
+            available = take_stock(requested, self)
+            if available:
+                raise InsufficientStock([(item, available[item.product_id]) for item in items if item.product_id in available])
+        self.status = 'pending'
+        # Stock shown on cached catalog pages just changed
+        purge_page_cache()
+        return True
+
     def restore_stock(self):
-        """Restore stock when an order is cancelled."""
+        """Restore stock when an order is cancelled, in one UPDATE for all lines."""
+        returned = {}
         for item in self.items.all():
-            item.product.stock += item.quantity
-            item.product.save(update_fields=['stock'])
+            returned[item.product_id] = returned.get(item.product_id, 0) + item.quantity
+        if not returned:
+            return
+        return_stock(returned, self)
+        purge_page_cache()
 
     def __str__(self):
         return f"Order {self.id} ({self.user.username}, {self.status})"
@@ -37,6 +110,11 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)  # Price at the time of order
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'product'], name='orderitem_order_product_idx'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name} (Order {self.order.id})"
     
\ No newline at end of file
@@ -1,3 +1,266 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+from decimal import Decimal
+from importlib import import_module
+from django.apps import apps
 
-# Create your tests here.
+from django.core import mail
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from jobs.models import Job
+from perf.testing import QueryBudgetMixin
+from products.models import Product
+from user.models import User
+from .models import InsufficientStock, Order, OrderItem
+
+TEST_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+
+def make_product(farmer, **kwargs):
+    defaults = dict(name='Tomato', description='Fresh', price=50, stock=10, category='vegetable', image='product_images/tomato.jpg')
+    defaults.update(kwargs)
+    return Product.objects.create(user=farmer, **defaults)
+
+
+def make_cart(user, *lines):
+    order = Order.objects.create(user=user, status='cart')
+    for product, quantity in lines:
+        OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+    return order
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = User.objects.create_user(username='farmer', email='farmer@example.com', password='pw', role='farmer')
+        cls.customer = User.objects.create_user(username='customer', email='customer@example.com', password='pw')
+
+    def test_place_decrements_every_line(self):
+        tomato = make_product(self.farmer, stock=5)
+        curd = make_product(self.farmer, name='Curd', stock=3)
+        order = make_cart(self.customer, (tomato, 2), (curd, 3))
+
+        # Savepoint, claim UPDATE, items, stock UPDATE, ledger INSERT, holds DELETE, release
+        with self.assertNumQueries(7):
+            self.assertTrue(order.place())
+
+        tomato.refresh_from_db()
+        curd.refresh_from_db()
+        self.assertEqual((tomato.stock, curd.stock), (3, 0))
+        self.assertEqual(order.status, 'pending')
+
+    def test_double_submit_takes_stock_once(self):
+        tomato = make_product(self.farmer, stock=5)
+        order = make_cart(self.customer, (tomato, 2))
+        # Both requests loaded the cart before either placed it
+        resubmitted = Order.objects.get(pk=order.pk)
+
+        self.assertTrue(order.place())
+        self.assertFalse(resubmitted.place())
+        tomato.refresh_from_db()
+        self.assertEqual(tomato.stock, 3)
+        self.assertEqual(tomato.stock_movements.filter(reason='sale').count(), 1)
+
+    def test_double_cancel_returns_stock_once(self):
+        tomato = make_product(self.farmer, stock=5)
+        order = make_cart(self.customer, (tomato, 2))
+        order.place()
+        self.client.force_login(self.customer)
+
+        self.client.post(reverse('payment:cancel_order', args=[order.id]))
+        self.client.post(reverse('payment:cancel_order', args=[order.id]))
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+        tomato.refresh_from_db()
+        self.assertEqual(tomato.stock, 5)
+        self.assertEqual(tomato.stock_movements.filter(reason='cancellation').count(), 1)
+
+    def test_shortfall_rolls_back_all_lines(self):
+        tomato = make_product(self.farmer, stock=5)
+        curd = make_product(self.farmer, name='Curd', stock=1)
+        order = make_cart(self.customer, (tomato, 2), (curd, 3))
+
+        with self.assertRaises(InsufficientStock) as ctx:
+            order.place()
+
+        self.assertEqual([(item.product_id, available) for item, available in ctx.exception.shortfalls], [(curd.id, 1)])
+        tomato.refresh_from_db()
+        order.refresh_from_db()
+        self.assertEqual(tomato.stock, 5)
+        self.assertEqual(order.status, 'cart')
+
+    def test_checkout_view_reports_shortfall(self):
+        tomato = make_product(self.farmer, stock=1)
+        make_cart(self.customer, (tomato, 2))
+        self.client.force_login(self.customer)
+
+        response = self.client.post(reverse('payment:checkout'), {'shipping_address': 'Kathmandu', 'payment_method': 'cash'})
+
+        self.assertContains(response, 'Tomato (Available: 1, Requested: 2)')
+        tomato.refresh_from_db()
+        self.assertEqual(tomato.stock, 1)
+
+    def test_checkout_queues_notification(self):
+        make_cart(self.customer, (make_product(self.farmer, stock=5), 2))
+        self.client.force_login(self.customer)
+        data = {'shipping_address': 'Kathmandu', 'payment_method': 'cash'}
+
+        self.client.post(reverse('payment:checkout'), data)
+        self.assertEqual(mail.outbox, [])
+        self.assertTrue(Job.objects.filter(name='payment.jobs.notify_order_status', status='queued').exists())
+
+        order = make_cart(self.customer, (make_product(self.farmer, stock=5), 1))
+        with self.settings(JOBS_EAGER=True):
+            self.client.post(reverse('payment:checkout'), data)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['customer@example.com', 'farmer@example.com'])
+        self.assertEqual(mail.outbox[0].subject, f'Order #{order.id} placed')
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class CartTotalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = User.objects.create_user(username='farmer', email='farmer@example.com', password='pw', role='farmer')
+        cls.customer = User.objects.create_user(username='customer', email='customer@example.com', password='pw')
+
+    def assertTotal(self, order, expected):
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal(expected))
+
+    def test_total_follows_line_changes(self):
+        tomato = make_product(self.farmer, price='12.50')
+        curd = make_product(self.farmer, name='Curd', price=40)
+        order = make_cart(self.customer, (tomato, 2))
+        self.assertTotal(order, '25.00')
+
+        item = OrderItem.objects.create(order=order, product=curd, quantity=1, price=curd.price)
+        self.assertTotal(order, '65.00')
+
+        item.quantity = 3
+        item.save()
+        self.assertTotal(order, '145.00')
+
+        item.delete()
+        self.assertTotal(order, '25.00')
+
+        order.items.all().delete()
+        self.assertTotal(order, '0.00')
+
+    def test_migration_backfills_stale_totals(self):
+        backfill = import_module('payment.migrations.0004_backfill_order_total_price').backfill_total_price
+        order = make_cart(self.customer, (make_product(self.farmer, price='12.50'), 2))
+        empty = Order.objects.create(user=self.customer, status='pending')
+        Order.objects.update(total_price=999)
+
+        backfill(apps, connection.schema_editor())
+        self.assertTotal(order, '25.00')
+        self.assertTotal(empty, '0.00')
+
+    def test_cart_and_checkout_pages_do_not_write(self):
+        make_cart(self.customer, (make_product(self.farmer), 2))
+        self.client.force_login(self.customer)
+
+        for url in (reverse('payment:cart'), reverse('payment:checkout')):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertContains(response, 'NPR 100.00')
+            writes = [q['sql'] for q in ctx.captured_queries if not q['sql'].startswith('SELECT')]
+            self.assertEqual(writes, [], url)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class ConcurrentCheckoutTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Needs a file-backed test database shared between threads.')
+
+    def test_concurrent_checkouts_never_oversell(self):
+        farmer = User.objects.create(username='farmer', email='farmer@example.com', role='farmer')
+        product = make_product(farmer, stock=10)
+        orders = [
+            make_cart(User.objects.create(username=f'c{i}', email=f'c{i}@example.com'), (product, 1))
+            for i in range(25)
+        ]
+        placed, short = [], []
+        start = threading.Barrier(len(orders))
+
+        def checkout(order):
+            try:
+                start.wait()
+                order.place()
+                placed.append(order.id)
+            except InsufficientStock:
+                short.append(order.id)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(order,)) for order in orders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(len(placed), 10)
+        self.assertEqual(len(short), 15)
+        self.assertEqual(Order.objects.filter(status='pending').count(), 10)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+@modify_settings(MIDDLEWARE={'remove': 'products.pagecache.PageCacheMiddleware'})
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every payment view stays within a fixed number of queries however long the order is."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = User.objects.create_user(username='farmer', email='farmer@example.com', password='pw', role='farmer')
+        cls.customer = User.objects.create_user(username='customer', email='customer@example.com', password='pw')
+        cls.products = [make_product(cls.farmer, name=f'Tomato {i}', stock=100) for i in range(20)]
+
+    def setUp(self):
+        self.client.force_login(self.customer)
+
+    def assertFlat(self, budget, request, status='cart'):
+        for lines in (1, 20):
+            order = make_cart(self.customer, *[(product, 2) for product in self.products[:lines]])
+            if status != 'cart':
+                Order.objects.filter(pk=order.pk).update(status=status)
+            order.first_item_id = order.items.order_by('id').values_list('id', flat=True).first()
+            with self.subTest(lines=lines), self.assertQueryBudget(budget, f'{lines} lines'):
+                response = request(order)
+            self.assertLess(response.status_code, 400)
+            Order.objects.filter(user=self.customer).delete()
+
+    def test_cart_and_checkout_pages(self):
+        self.assertFlat(3, lambda order: self.client.get(reverse('payment:cart')))
+        self.assertFlat(3, lambda order: self.client.get(reverse('payment:checkout')))
+
+    def test_checkout(self):
+        data = {'shipping_address': 'Kathmandu', 'payment_method': 'cash'}
+        # The cart is claimed in one UPDATE and its lines re-read in the transaction; stock is taken
+        # in one UPDATE, journaled in one INSERT and its holds dropped in one DELETE
+        self.assertFlat(11, lambda order: self.client.post(reverse('payment:checkout'), data))
+
+    def test_order_confirmation(self):
+        self.assertFlat(3, lambda order: self.client.get(reverse('payment:order_confirmation', args=[order.id])), 'pending')
+
+    def test_cart_item_changes(self):
+        # Plus moving the line's stock hold: availability check, upsert, renewing the cart's other holds
+        self.assertFlat(9, lambda order: self.client.post(reverse('payment:update_cart_item', args=[order.first_item_id]), {'quantity': 3}))
+        self.assertFlat(5, lambda order: self.client.post(reverse('payment:remove_cart_item', args=[order.first_item_id])))
+
+    def test_cancel_order(self):
+        # The order is claimed by one UPDATE in the same transaction as the stock UPDATE and
+        # ledger INSERT (two savepoint queries each for the view and return_stock here)
+        self.assertFlat(11, lambda order: self.client.post(reverse('payment:cancel_order', args=[order.id])), 'pending')
@@ -0,0 +1,251 @@
+"""End-to-end HTTP benchmarks for the main shopping flows.
+
+Each flow is a short script of real requests (browse, product detail, add to
+cart, cart, checkout, login) run by ``concurrency`` simulated users, either
+in-process through the URLconf with the test ``Client`` or over HTTP against
+a running server. Every request is timed, and in-process runs also count the
+SQL queries it made. ``run`` returns a plain dict that is saved as JSON so a
+later run can be compared against it.
+"""
+import http.cookiejar
+import math
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from products.models import Product
+from products.pagination import CursorPaginator
+from products.views import PRODUCTS_PER_PAGE, SORT_ORDERINGS
+from user.models import User
+from .dataset import PASSWORD
+
+SEARCH_TERMS = ['tomato', 'organic', 'milk', 'seed', 'honey', 'fresh app', 'chitwan']
+DEEP_PAGES = (10, 50, 200)
+CHECKOUT_FORM = {'shipping_address': 'Shantinagar, Kathmandu', 'payment_method': 'cash'}
+
+
+class InProcessSession:
+    """One simulated user talking to the URLconf directly; counts queries too.
+
+    A view that raises is recorded as the 500 a server would answer with; the
+    exception is kept on ``error`` until the next request.
+    """
+
+    def __init__(self):
+        self.client = Client(SERVER_NAME='localhost', raise_request_exception=False)
+        self.error = None
+
+    def request(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data or {})
+        self.error = response.exc_info[1] if response.exc_info else None
+        return response.status_code, len(queries)
+
+
+class _NoRedirects(urllib.request.HTTPRedirectHandler):
+    # The redirect is the response, as in-process; following it would time two requests
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class HttpSession:
+    """One simulated user talking to a running server, with its own cookie jar."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirects)
+
+    def request(self, method, url, data=None):
+        body, headers = None, {}
+        if method == 'post':
+            body = urllib.parse.urlencode(data or {}).encode()
+            token = next((c.value for c in self.cookies if c.name == 'csrftoken'), None)
+            if token is None:
+                self.opener.open(self.base_url + reverse('login')).read()
+                token = next(c.value for c in self.cookies if c.name == 'csrftoken')
+            headers = {'X-CSRFToken': token, 'Referer': self.base_url + url}
+        request = urllib.request.Request(self.base_url + url, data=body, headers=headers, method=method.upper())
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status, None
+        except urllib.error.HTTPError as error:
+            return error.code, None
+
+
+class Fixtures:
+    """Ids, cursors and accounts the flows pick from, loaded once before timing starts."""
+
+    def __init__(self, customers):
+        self.product_ids = list(Product.objects.filter(stock__gte=100).values_list('id', flat=True)[:2000])
+        if not self.product_ids:
+            raise ValueError("No products with stock; run generate_dataset first.")
+        self.emails = list(
+            User.objects.filter(role='customer').order_by('id').values_list('email', flat=True)[:customers]
+        )
+        if len(self.emails) < customers:
+            raise ValueError(f"Need {customers} customer accounts, found {len(self.emails)}.")
+        self.cursors = []
+        for sort in ('price_asc', 'date_desc'):
+            paginator = CursorPaginator(Product.objects.all(), SORT_ORDERINGS[sort], PRODUCTS_PER_PAGE)
+            for depth in DEEP_PAGES:
+                boundary = Product.objects.order_by(*SORT_ORDERINGS[sort])[depth * PRODUCTS_PER_PAGE - 1:][:1].first()
+                if boundary is not None:
+                    self.cursors.append((sort, paginator.encode_cursor(boundary, 'n')))
+        self.categories = [code for code, _ in Product.CATEGORIES]
+
+    def catalog_query(self, rng):
+        choice = rng.randrange(5)
+        if choice == 0:
+            return {}
+        if choice == 1:
+            return {'q': rng.choice(SEARCH_TERMS)}
+        if choice == 2:
+            return {'category': rng.choice(self.categories), 'sort': 'price_asc'}
+        if choice == 3 and self.cursors:
+            sort, cursor = rng.choice(self.cursors)
+            return {'sort': sort, 'cursor': cursor}
+        return {'sort': rng.choice(list(SORT_ORDERINGS)[:4])}
+
+
+def _login(session, email):
+    return session.request('post', reverse('login'), {'email': email, 'password': PASSWORD})
+
+
+# flow name -> (needs a logged-in customer, steps); a step is (label, function returning (method, url, data))
+FLOWS = {
+    'browse': (False, [
+        ('view_products', lambda f, rng: ('get', reverse('view_products') + '?' + urllib.parse.urlencode(f.catalog_query(rng)), None)),
+    ]),
+    'product_detail': (False, [
+        ('product_detail', lambda f, rng: ('get', reverse('product_detail', args=[rng.choice(f.product_ids)]), None)),
+    ]),
+    'cart': (True, [
+        ('add_to_cart', lambda f, rng: ('post', reverse('add_to_cart', args=[rng.choice(f.product_ids)]), {'quantity': 1})),
+        ('cart_view', lambda f, rng: ('get', reverse('payment:cart'), None)),
+    ]),
+    'checkout': (True, [
+        ('add_to_cart', lambda f, rng: ('post', reverse('add_to_cart', args=[rng.choice(f.product_ids)]), {'quantity': 1})),
+        ('checkout_form', lambda f, rng: ('get', reverse('payment:checkout'), None)),
+        ('checkout', lambda f, rng: ('post', reverse('payment:checkout'), CHECKOUT_FORM)),
+    ]),
+    'login': (False, [
+        ('login_view', None),
+    ]),
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def summarize(samples, elapsed):
+    """Throughput, latency percentiles (ms) and queries per request for one label."""
+    latencies = sorted(ms for ms, _, _ in samples)
+    queries = [q for _, _, q in samples if q is not None]
+    errors = sum(1 for _, status, _ in samples if status >= 400)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'throughput': round(len(samples) / elapsed, 2) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'mean_ms': round(statistics.fmean(latencies), 2),
+        'queries_per_request': round(statistics.fmean(queries), 2) if queries else None,
+    }
+
+
+def run_flow(name, fixtures, make_session, concurrency, iterations, seed):
+    """Run one flow with ``concurrency`` users doing ``iterations`` passes each; returns stats per label."""
+    needs_login, steps = FLOWS[name]
+    samples = {}
+    lock = threading.Lock()
+
+    def user(worker):
+        rng = random.Random(f'{seed}:{name}:{worker}')
+        session = make_session()
+        email = fixtures.emails[worker % len(fixtures.emails)]
+        try:
+            if needs_login:
+                _login(session, email)
+            for _ in range(iterations):
+                for label, step in steps:
+                    if step is None:
+                        # The login flow times the login itself, with a fresh session each time
+                        session = make_session()
+                        method, url, data = 'post', reverse('login'), {'email': email, 'password': PASSWORD}
+                    else:
+                        method, url, data = step(fixtures, rng)
+                    started = time.perf_counter()
+                    status, queries = session.request(method, url, data)
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with lock:
+                        samples.setdefault(label, []).append((elapsed, status, queries))
+        finally:
+            if concurrency > 1:
+                connection.close()  # this thread's own connection
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        user(0)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(user, worker) for worker in range(concurrency)]:
+                future.result()
+    elapsed = time.perf_counter() - started
+    return {label: summarize(values, elapsed) for label, values in samples.items()}
+
+
+def run(flows, concurrency=4, iterations=25, base_url=None, seed=1, log=None):
+    """Benchmark ``flows`` and return a JSON-serialisable report."""
+    log = log or (lambda message: None)
+    fixtures = Fixtures(concurrency)
+    make_session = (lambda: HttpSession(base_url)) if base_url else InProcessSession
+    report = {
+        'meta': {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'target': base_url or 'in-process',
+            'concurrency': concurrency,
+            'iterations': iterations,
+            'seed': seed,
+            'products': Product.objects.count(),
+        },
+        'results': {},
+    }
+    for name in flows:
+        log(f"Running {name}...")
+        report['results'].update(run_flow(name, fixtures, make_session, concurrency, iterations, seed))
+    return report
+
+
+def compare(current, baseline, threshold):
+    """Yield (label, metric, before, after, change %, regressed) for the metrics that matter."""
+    for label, stats in current['results'].items():
+        before = baseline.get('results', {}).get(label)
+        if not before:
+            continue
+        for metric, higher_is_worse in (('p95_ms', True), ('p99_ms', True), ('throughput', False),
+                                        ('queries_per_request', True)):
+            old, new = before.get(metric), stats.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            regressed = change > threshold if higher_is_worse else change < -threshold
+            if metric == 'queries_per_request':
+                regressed = new > old
+            yield label, metric, old, new, change, regressed
@@ -0,0 +1,217 @@
+"""Deterministic, production-sized data for performance work.
+
+``generate`` fills the database with farmers, customers, products in every
+category, open carts with their stock holds and a long order history, all
+through batched
+``bulk_create`` calls. Given the same seed, counts and end date it produces
+the same rows every time, so benchmark runs can be compared.
+
+Popularity is skewed the way real shops are: a few farmers list most of the
+products, a few products appear in most orders and a few customers place most
+of them.
+"""
+import contextlib
+import random
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageDraw
+
+from payment.models import Order, OrderItem
+from products.facets import rebuild_facets
+from products.images import generate_derivatives
+from products.models import Product, StockHold
+from products.pagecache import purge_page_cache
+from user.models import User
+
+# Every generated account uses this password, so login can be benchmarked too
+PASSWORD = 'krishik-perf'
+EMAIL_DOMAIN = 'perf.krishikbazar.test'
+
+# category -> (product names, price range in NPR, placeholder image colour)
+CATALOG = {
+    'vegetable': (
+        ['Tomato', 'Potato', 'Onion', 'Cauliflower', 'Spinach', 'Cabbage', 'Carrot', 'Radish', 'Brinjal', 'Okra'],
+        (30, 250), (196, 48, 43),
+    ),
+    'fruit': (
+        ['Apple', 'Banana', 'Orange', 'Mango', 'Papaya', 'Guava', 'Pomegranate', 'Litchi', 'Kiwi', 'Pear'],
+        (60, 600), (240, 160, 30),
+    ),
+    'seed': (
+        ['Maize Seed', 'Wheat Seed', 'Paddy Seed', 'Mustard Seed', 'Lentil Seed', 'Soybean Seed'],
+        (80, 1200), (150, 110, 60),
+    ),
+    'dairy': (
+        ['Milk', 'Curd', 'Ghee', 'Paneer', 'Butter', 'Chhurpi'],
+        (90, 1500), (235, 230, 210),
+    ),
+    'other': (
+        ['Honey', 'Timur', 'Cardamom', 'Ginger', 'Turmeric', 'Buckwheat Flour'],
+        (100, 2000), (70, 130, 80),
+    ),
+}
+ADJECTIVES = ['Fresh', 'Organic', 'Local', 'Hill', 'Terai', 'Premium', 'Farm', 'Seasonal']
+DISTRICTS = ['Kathmandu', 'Lalitpur', 'Bhaktapur', 'Chitwan', 'Kaski', 'Ilam', 'Jhapa', 'Dolakha', 'Mustang', 'Palpa']
+
+# Historical order outcomes, and how many units of a product a line asks for
+ORDER_STATUSES = (('completed', 78), ('pending', 12), ('cancelled', 10))
+QUANTITIES = ((1, 40), (2, 25), (3, 15), (4, 8), (5, 7), (10, 5))
+
+
+@contextlib.contextmanager
+def manual_timestamps(*models):
+    """Let bulk_create keep the created_at/updated_at values we generate."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def pareto_weights(rng, count, alpha=1.16):
+    """Cumulative weights for ``rng.choices`` that give roughly an 80/20 split."""
+    return list(accumulate(rng.paretovariate(alpha) for _ in range(count)))
+
+
+def placeholder_images():
+    """Store one placeholder image per category and return {category: (name, derivatives)}."""
+    images = {}
+    for category, (_, _, colour) in CATALOG.items():
+        image = Image.new('RGB', (800, 600), colour)
+        ImageDraw.Draw(image).ellipse((200, 100, 600, 500), fill=tuple(255 - c for c in colour))
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        name = default_storage.save(f'product_images/perf_{category}.jpg', ContentFile(buffer.getvalue()))
+        images[category] = (name, generate_derivatives(Product(image=name).image))
+    return images
+
+
+def generate(seed=1, farmers=200, customers=5000, products=10000, orders=250000, carts=1000,
+             items_per_order=4.0, days=365, batch_size=5000, end=None, log=None):
+    """Create the dataset and return the number of rows made per model."""
+    if products < 1 and (orders or carts):
+        raise ValueError("Orders and carts need at least one product.")
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    hold_for = timedelta(seconds=getattr(settings, 'STOCK_HOLD_SECONDS', 900))
+    start = end - timedelta(days=days)
+
+    def moment(after=None):
+        earliest = after or start
+        return earliest + timedelta(seconds=rng.randrange(max(int((end - earliest).total_seconds()), 1)))
+
+    with manual_timestamps(User, Product, Order):
+        # 1. Accounts. Hash the shared password once: per-user hashing would take hours.
+        password = make_password(PASSWORD, salt=f'perf{seed}')
+        accounts = []
+        for role, count in (('farmer', farmers), ('customer', customers)):
+            for n in range(count):
+                joined = moment()
+                accounts.append(User(
+                    username=f'{role}{n:06d}', email=f'{role}{n:06d}@{EMAIL_DOMAIN}', password=password,
+                    role=role, phone=f'98{rng.randrange(10 ** 8):08d}', address=rng.choice(DISTRICTS),
+                    date_joined=joined, created_at=joined, updated_at=joined,
+                ))
+        User.objects.bulk_create(accounts, batch_size=batch_size)
+        farmer_rows = accounts[:farmers]
+        customer_rows = accounts[farmers:]
+        log(f"{len(accounts)} users")
+
+        # 2. Products, skewed towards a few big farmers
+        images = placeholder_images()
+        farmer_weights = pareto_weights(rng, farmers)
+        catalog = []
+        for _ in range(products):
+            category = rng.choice(list(CATALOG))
+            names, (low, high), _ = CATALOG[category]
+            base, adjective, district = rng.choice(names), rng.choice(ADJECTIVES), rng.choice(DISTRICTS)
+            farmer = rng.choices(farmer_rows, cum_weights=farmer_weights)[0]
+            listed = moment(farmer.created_at)
+            image, derivatives = images[category]
+            catalog.append(Product(
+                user_id=farmer.pk, name=f'{adjective} {base}', category=category,
+                description=f'{adjective} {base.lower()} from {district}, sold directly by {farmer.username}.',
+                price=Decimal(min(high, low * rng.lognormvariate(0.4, 0.5))).quantize(Decimal('0.01')),
+                stock=0 if rng.random() < 0.1 else rng.randrange(1, 500),
+                image=image, image_derivatives=derivatives,
+                created_at=listed, updated_at=moment(listed),
+            ))
+        Product.objects.bulk_create(catalog, batch_size=batch_size)
+        log(f"{len(catalog)} products")
+
+        # 3. Order history and open carts, skewed towards popular products and loyal customers
+        product_weights = pareto_weights(rng, products)
+        customer_weights = pareto_weights(rng, customers)
+        statuses, status_weights = zip(*ORDER_STATUSES)
+        quantities, quantity_weights = zip(*QUANTITIES)
+        extra_items = max(items_per_order - 1, 0)
+
+        def build_lines(count):
+            # Distinct products per order; give up on the rare draw that keeps repeating
+            lines = {}
+            for _ in range(count * 4):
+                product = rng.choices(catalog, cum_weights=product_weights)[0]
+                lines.setdefault(product.pk, (product, rng.choices(quantities, quantity_weights)[0]))
+                if len(lines) == count:
+                    break
+            return list(lines.values())
+
+        cart_owners = set(rng.sample(range(customers), min(carts, customers)))
+        plan = [(rng.choices(range(customers), cum_weights=customer_weights)[0], None) for _ in range(orders)]
+        plan += [(index, 'cart') for index in sorted(cart_owners)]
+
+        item_count = hold_count = 0
+        for offset in range(0, len(plan), batch_size):
+            with transaction.atomic():
+                batch, lines = [], []
+                for index, status in plan[offset:offset + batch_size]:
+                    customer = customer_rows[index]
+                    count = 1 + (min(round(rng.expovariate(1 / extra_items)), 24) if extra_items else 0)
+                    order_lines = build_lines(count if status != 'cart' else rng.randrange(1, 6))
+                    placed = moment(customer.created_at)
+                    batch.append(Order(
+                        user_id=customer.pk, status=status or rng.choices(statuses, status_weights)[0],
+                        total_price=sum(product.price * quantity for product, quantity in order_lines),
+                        created_at=placed, updated_at=placed,
+                    ))
+                    lines.append(order_lines)
+                Order.objects.bulk_create(batch)
+                items = [
+                    OrderItem(order_id=order.pk, product_id=product.pk, quantity=quantity, price=product.price)
+                    for order, order_lines in zip(batch, lines) for product, quantity in order_lines
+                ]
+                OrderItem.objects.bulk_create(items, batch_size=batch_size)
+                # What add-to-cart would have reserved; carts older than the TTL hold nothing any more
+                holds = [
+                    StockHold(order_id=order.pk, product_id=product.pk, quantity=quantity,
+                              expires_at=order.updated_at + hold_for)
+                    for order, order_lines in zip(batch, lines) if order.status == 'cart'
+                    for product, quantity in order_lines
+                ]
+                StockHold.objects.bulk_create(holds, batch_size=batch_size)
+                item_count += len(items)
+                hold_count += len(holds)
+            log(f"{min(offset + batch_size, len(plan))}/{len(plan)} orders, {item_count} items")
+
+    # bulk_create skips the signals that keep the facet table current
+    rebuild_facets()
+    purge_page_cache()
+    return {
+        'users': len(accounts), 'products': len(catalog), 'orders': len(plan), 'order items': item_count,
+        'stock holds': hold_count,
+    }
@@ -0,0 +1,60 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from perf.benchmark import FLOWS, compare, run
+
+
+class Command(BaseCommand):
+    help = "Benchmark the main shopping flows and report throughput, latency percentiles and queries per request."
+
+    def add_arguments(self, parser):
+        parser.add_argument('flows', nargs='*', help=f"Flows to run: {', '.join(FLOWS)} (default: all).")
+        parser.add_argument('--concurrency', type=int, default=4, help="Simulated users running at once.")
+        parser.add_argument('--iterations', type=int, default=25, help="Passes through the flow per user.")
+        parser.add_argument('--url', help="Benchmark a running server at this base URL instead of in-process.")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+        parser.add_argument('--compare', help="JSON results of an earlier run to compare against.")
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help="Percent change in p95/p99/throughput counted as a regression.")
+
+    def handle(self, *args, **options):
+        unknown = [name for name in options['flows'] if name not in FLOWS]
+        if unknown:
+            raise CommandError(f"Unknown flow(s): {', '.join(unknown)}. Choose from {', '.join(FLOWS)}.")
+        baseline = json.loads(Path(options['compare']).read_text()) if options['compare'] else None
+        try:
+            report = run(
+                options['flows'] or list(FLOWS), concurrency=options['concurrency'],
+                iterations=options['iterations'], base_url=options['url'], seed=options['seed'],
+                log=lambda message: self.stderr.write(message) if options['verbosity'] > 1 else None,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(f"{'request':<16}{'reqs':>7}{'errors':>8}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}")
+        for label, stats in report['results'].items():
+            queries = '-' if stats['queries_per_request'] is None else f"{stats['queries_per_request']:.1f}"
+            self.stdout.write(
+                f"{label:<16}{stats['requests']:>7}{stats['errors']:>8}{stats['throughput']:>9.1f}"
+                f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{queries:>9}"
+            )
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"Saved results to {options['output']}")
+
+        if baseline:
+            changed = [key for key in ('target', 'concurrency', 'iterations') if baseline['meta'].get(key) != report['meta'][key]]
+            if changed:
+                self.stdout.write(self.style.WARNING(f"Baseline was run with a different {', '.join(changed)}."))
+            regressions = []
+            for label, metric, old, new, change, regressed in compare(report, baseline, options['threshold']):
+                line = f"{label:<16}{metric:<20}{old:>10.2f} -> {new:<10.2f}{change:+.1f}%"
+                self.stdout.write(self.style.ERROR(line) if regressed else line)
+                if regressed:
+                    regressions.append(f"{label} {metric}")
+            if regressions:
+                raise CommandError(f"Regressed against {options['compare']}: {', '.join(regressions)}")
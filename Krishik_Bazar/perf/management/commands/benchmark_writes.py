@@ -0,0 +1,47 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from perf.writebench import PROFILES, run
+
+
+class Command(BaseCommand):
+    help = (
+        "Run add-to-cart and checkout from several processes at once against a scratch copy of a seeded "
+        "SQLite database, once per connection profile, and compare write throughput and lock errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('profiles', nargs='*', help=f"Profiles to run: {', '.join(PROFILES)} (default: all).")
+        parser.add_argument('--processes', type=int, default=4, help="Worker processes writing at once.")
+        parser.add_argument('--iterations', type=int, default=25, help="Add-to-cart + checkout rounds per process.")
+        parser.add_argument('--products', type=int, default=200, help="Products in the scratch database.")
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        unknown = [name for name in options['profiles'] if name not in PROFILES]
+        if unknown:
+            raise CommandError(f"Unknown profile(s): {', '.join(unknown)}. Choose from {', '.join(PROFILES)}.")
+        report = run(
+            processes=options['processes'], iterations=options['iterations'],
+            profiles=options['profiles'] or PROFILES, products=options['products'],
+            log=lambda message: self.stderr.write(message) if options['verbosity'] > 1 else None,
+        )
+
+        self.stdout.write(f"{'profile':<12}{'request':<14}{'reqs':>6}{'errors':>8}{'locked':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+        for name, result in report['results'].items():
+            for label, stats in result['requests'].items():
+                self.stdout.write(
+                    f"{name:<12}{label:<14}{stats['requests']:>6}{stats['errors']:>8}{stats['locked']:>8}"
+                    f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}"
+                )
+        for name, result in report['results'].items():
+            self.stdout.write(
+                f"{name}: {result['checkouts']} checkouts in {result['elapsed_s']:.2f}s "
+                f"({result['checkouts_per_second']} per second)"
+            )
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"Saved results to {options['output']}")
@@ -0,0 +1,47 @@
+import time
+from datetime import date, datetime, time as clock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from perf.dataset import EMAIL_DOMAIN, PASSWORD, generate
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = "Fill the database with a large, seeded dataset for performance testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--farmers', type=int, default=200)
+        parser.add_argument('--customers', type=int, default=5000)
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--orders', type=int, default=250000, help="Historical (non-cart) orders.")
+        parser.add_argument('--carts', type=int, default=1000, help="Customers with an open cart.")
+        parser.add_argument('--items-per-order', type=float, default=4.0, help="Mean line items per order.")
+        parser.add_argument('--days', type=int, default=365, help="How far back the history goes.")
+        parser.add_argument('--end', type=date.fromisoformat, default=None,
+                            help="Last day of the history (YYYY-MM-DD, default today); fix it to reproduce a dataset exactly.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').exists():
+            raise CommandError("This database already has generated data; run against a fresh database.")
+        if options['farmers'] < 1 or options['customers'] < 1:
+            raise CommandError("Need at least one farmer and one customer.")
+        if options['products'] < 1 and (options['orders'] or options['carts']):
+            raise CommandError("Orders and carts need at least one product; pass --orders 0 --carts 0 for none.")
+
+        end_day = options['end'] or timezone.localdate()
+        end = timezone.make_aware(datetime.combine(end_day, clock.min))
+        started = time.monotonic()
+        counts = generate(
+            seed=options['seed'], farmers=options['farmers'], customers=options['customers'],
+            products=options['products'], orders=options['orders'], carts=options['carts'],
+            items_per_order=options['items_per_order'], days=options['days'],
+            batch_size=options['batch_size'], end=end,
+            log=lambda message: self.stdout.write(f"  {message}") if options['verbosity'] > 1 else None,
+        )
+        summary = ', '.join(f"{count} {name}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Created {summary} in {time.monotonic() - started:.0f}s."))
+        self.stdout.write(f"Every generated account uses the password '{PASSWORD}'.")
@@ -0,0 +1,54 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+MODES = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+
+
+class Command(BaseCommand):
+    help = (
+        "Checkpoint the SQLite write-ahead log into the database file, optionally vacuuming it, "
+        "once or every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--mode', default='TRUNCATE', choices=MODES,
+                            help="PASSIVE never waits for readers or writers; TRUNCATE (default) also empties the WAL file.")
+        parser.add_argument('--vacuum', action='store_true', help="Rebuild the database file to reclaim free pages.")
+        parser.add_argument('--interval', type=float, help="Keep running, checkpointing every this many seconds.")
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError("sqlite_checkpoint only works on SQLite databases.")
+        while True:
+            self.checkpoint(connection, options['mode'], options['vacuum'])
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def checkpoint(self, connection, mode, vacuum):
+        wal = f"{connection.settings_dict['NAME']}-wal"
+        before = os.path.getsize(wal) if os.path.exists(wal) else 0
+        with connection.cursor() as cursor:
+            if vacuum:
+                # In WAL mode the rebuilt pages go through the WAL, so vacuum before checkpointing
+                cursor.execute('VACUUM')
+            # Refresh the query planner's statistics where they have drifted
+            cursor.execute('PRAGMA optimize')
+            cursor.execute(f'PRAGMA wal_checkpoint({mode})')
+            busy, log_frames, checkpointed = cursor.fetchone()
+        if log_frames == -1:
+            raise CommandError("The database is not in WAL mode; nothing to checkpoint.")
+        after = os.path.getsize(wal) if os.path.exists(wal) else 0
+
+        message = f"Checkpointed {checkpointed} of {log_frames} WAL frames; WAL {before // 1024} KiB -> {after // 1024} KiB"
+        if vacuum:
+            message += ", vacuumed"
+        if busy:
+            self.stdout.write(self.style.WARNING(message + " (blocked by an open reader or writer, run again later)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,56 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from Krishik_Bazar.routers import REPLICA
+from products.facets import purge_facet_cache
+from products.pagecache import purge_page_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database into the read replica with SQLite's online backup, "
+        "once or every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', help="Replica file to write; defaults to the NAME of the 'replica' database.")
+        parser.add_argument('--interval', type=float, help="Keep running, syncing every this many seconds.")
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError("sync_replica only works on SQLite databases.")
+        target = options['to']
+        if not target:
+            if REPLICA not in connections.settings:
+                raise CommandError("No 'replica' database is configured; set REPLICA_DATABASE or pass --to.")
+            target = connections.settings[REPLICA]['NAME']
+        if str(target) == str(primary.settings_dict['NAME']):
+            raise CommandError("The replica is the primary database file.")
+        while True:
+            self.sync(primary, str(target))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, primary, target):
+        primary.ensure_connection()
+        started = time.perf_counter()
+        # Copied in place, page by page, so replica connections stay open and
+        # simply see the new data on their next read
+        replica = sqlite3.connect(target, timeout=20)
+        try:
+            primary.connection.backup(replica)
+            replica.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            pages = replica.execute('PRAGMA page_count').fetchone()[0]
+        finally:
+            replica.close()
+        # Pages and counts cached in between may have come from the old copy
+        purge_page_cache()
+        purge_facet_cache()
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced {pages} pages to {target} in {(time.perf_counter() - started) * 1000:.0f} ms"
+        ))
@@ -0,0 +1,130 @@
+"""Per-request timing: SQL, template rendering and view time.
+
+With ``REQUEST_TIMING`` on, every response gets a ``Server-Timing`` header
+(shown in the browser's network panel) and one JSON log line on the
+``perf.requests`` logger. Requests slower than ``REQUEST_TIMING_SLOW_MS`` are
+additionally logged with their full query list, for a sampled
+``REQUEST_TIMING_SLOW_SAMPLE_RATE`` fraction of them.
+
+When the setting is off the middleware removes itself from the stack at
+startup, so it costs nothing.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('perf.requests')
+
+_current = contextvars.ContextVar('request_timing', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.queries = []  # (alias, sql, ms)
+        self.template_ms = 0.0
+        self.template_depth = 0
+
+    def record_query(self, alias):
+        def wrapper(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.queries.append((alias, sql, (time.perf_counter() - started) * 1000))
+        return wrapper
+
+    @property
+    def sql_ms(self):
+        return sum(ms for _, _, ms in self.queries)
+
+
+def _install_template_timer():
+    """Time Django template renders made while a request is being measured."""
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, 'timed', False):
+        return
+    original = Template.render
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return original(self, context, request)
+        # Only the outermost render counts; render_to_string inside a tag is already inside it
+        stats.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            stats.template_depth -= 1
+            if not stats.template_depth:
+                stats.template_ms += (time.perf_counter() - started) * 1000
+
+    render.timed = True
+    Template.render = render
+
+
+class RequestTimingMiddleware:
+    """Put first in MIDDLEWARE so the total covers every other middleware."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_TIMING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'REQUEST_TIMING_SLOW_MS', 500)
+        self.sample_rate = getattr(settings, 'REQUEST_TIMING_SLOW_SAMPLE_RATE', 1.0)
+        _install_template_timer()
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            with contextlib.ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(stats.record_query(alias)))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        total_ms = (time.perf_counter() - stats.started) * 1000
+        view_ms = (time.perf_counter() - stats.view_started) * 1000 if stats.view_started else 0.0
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={stats.sql_ms:.1f};desc="{len(stats.queries)} queries"',
+            f'tpl;dur={stats.template_ms:.1f}',
+            f'view;dur={view_ms:.1f}',
+            f'total;dur={total_ms:.1f}',
+        ])
+
+        match = request.resolver_match
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': len(stats.queries),
+            'db_ms': round(stats.sql_ms, 2),
+            'template_ms': round(stats.template_ms, 2),
+            'view_ms': round(view_ms, 2),
+            'total_ms': round(total_ms, 2),
+        }
+        logger.info(json.dumps(record))
+        if total_ms >= self.slow_ms and random.random() < self.sample_rate:
+            record['sql'] = [
+                {'db': alias, 'ms': round(ms, 2), 'sql': sql} for alias, sql, ms in stats.queries
+            ]
+            logger.warning(json.dumps(record))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = _current.get()
+        if stats is not None:
+            stats.view_started = time.perf_counter()
@@ -0,0 +1,102 @@
+"""Profile a single request on demand.
+
+A staff user adds ``?profile=`` to a URL, or sends an ``X-Profile`` header,
+and that one request runs under a profiler:
+
+* ``cprofile`` (the default) writes a ``.prof`` file for ``pstats``,
+  snakeviz and friends;
+* ``sample`` polls the request thread's stack every
+  ``PROFILE_SAMPLE_INTERVAL`` seconds and writes ``.collapsed`` stacks, the
+  input format of flamegraph.pl and speedscope. It distorts timings far less
+  than cProfile on query-heavy pages.
+
+Files go to ``PROFILE_DIR`` and the response carries an ``X-Profile-Url``
+header pointing at the staff-only download view.
+"""
+import cProfile
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.urls import reverse
+
+MODES = ('cprofile', 'sample')
+
+
+def profile_dir():
+    return str(settings.PROFILE_DIR)
+
+
+class Sampler:
+    """Count the distinct stacks of one thread, sampled from a background thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _requested_mode(request):
+    value = request.headers.get('X-Profile', request.GET.get('profile'))
+    if value is None:
+        return None
+    return value if value in MODES else 'cprofile'
+
+
+class ProfilerMiddleware:
+    """Must come after AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = _requested_mode(request)
+        # Only look at the user once asked to, so ordinary requests load nothing
+        if mode is None or not request.user.is_staff:
+            return self.get_response(request)
+
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}'
+        os.makedirs(profile_dir(), exist_ok=True)
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            response = profiler.runcall(self.get_response, request)
+            name += '.prof'
+            profiler.dump_stats(os.path.join(profile_dir(), name))
+        else:
+            interval = getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.001)
+            with Sampler(threading.get_ident(), interval) as sampler:
+                response = self.get_response(request)
+            name += '.collapsed'
+            with open(os.path.join(profile_dir(), name), 'w') as output:
+                output.write(sampler.collapsed())
+
+        response['X-Profile-Url'] = request.build_absolute_uri(reverse('perf:profile_file', args=[name]))
+        return response
@@ -0,0 +1,67 @@
+"""Test helpers for pinning how many SQL queries a request may make.
+
+``assertQueryBudget`` records every query along with where it came from: the
+template line being rendered, or else the innermost project source line. When
+a request goes over budget the failure lists the queries grouped by that
+origin, so an N+1 in a template loop shows up as one line with a large count.
+"""
+import contextlib
+import os
+import sys
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.template.base import Node
+
+PROJECT_DIR = os.path.join(str(settings.BASE_DIR), '')
+THIS_FILE = os.path.abspath(__file__)
+
+
+def query_origin(frame):
+    """'template.html:42' for queries run while rendering, else 'path/to/module.py:17 in func'."""
+    call_site = None
+    while frame is not None:
+        node = frame.f_locals.get('self') if frame.f_code.co_name == 'render_annotated' else None
+        if isinstance(node, Node) and node.token is not None and node.origin is not None:
+            return f'{node.origin.template_name}:{node.token.lineno}'
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if (call_site is None and filename.startswith(PROJECT_DIR) and filename != THIS_FILE
+                and '/migrations/' not in filename):
+            call_site = f'{os.path.relpath(filename, PROJECT_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return call_site or '<django>'
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((query_origin(sys._getframe(1)), sql))
+        return execute(sql, params, many, context)
+
+    def report(self):
+        by_origin = defaultdict(list)
+        for origin, sql in self.queries:
+            by_origin[origin].append(sql)
+        lines = []
+        for origin, statements in sorted(by_origin.items(), key=lambda item: -len(item[1])):
+            lines.append(f'  {len(statements):>3} x {origin}')
+            for sql, count in Counter(statements).most_common(3):
+                lines.append(f'        {count:>3} x {sql[:200]}')
+        return '\n'.join(lines)
+
+
+class QueryBudgetMixin:
+    """TestCase mixin with ``assertQueryBudget``."""
+
+    @contextlib.contextmanager
+    def assertQueryBudget(self, budget, label=''):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            yield recorder
+        if len(recorder.queries) > budget:
+            self.fail(
+                f'{label or "Block"} made {len(recorder.queries)} queries, budget is {budget}:\n{recorder.report()}'
+            )
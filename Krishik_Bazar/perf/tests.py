@@ -0,0 +1,364 @@
+import json
+import os
+import pstats
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime, timezone
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, router, transaction
+from django.urls import reverse
+from django.db.models import F, Sum
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from Krishik_Bazar.routers import STICKY_SESSION_KEY
+from payment.models import Order, OrderItem
+from products.models import CatalogFacet, Product, StockHold
+from user.models import User
+from .benchmark import FLOWS, HttpSession, InProcessSession, compare, run
+from .dataset import generate
+from .writebench import run as run_write_benchmark
+
+TEST_MEDIA_ROOT = tempfile.mkdtemp()
+END = datetime(2026, 1, 1, tzinfo=timezone.utc)
+SIZES = dict(farmers=3, customers=20, products=40, orders=60, carts=5, batch_size=25, end=END)
+
+
+def tearDownModule():
+    shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+
+def snapshot():
+    return (
+        list(User.objects.order_by('username').values_list('username', 'role', 'date_joined')),
+        list(Product.objects.order_by('id').values_list('name', 'category', 'price', 'stock', 'created_at')),
+        list(Order.objects.order_by('id').values_list('user__username', 'status', 'total_price', 'created_at')),
+        list(OrderItem.objects.order_by('id').values_list('order__created_at', 'product__name', 'quantity', 'price')),
+    )
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class DatasetTests(TestCase):
+    def test_same_seed_same_data(self):
+        with transaction.atomic():
+            generate(seed=7, **SIZES)
+            first = snapshot()
+            transaction.set_rollback(True)
+
+        counts = generate(seed=7, **SIZES)
+
+        self.assertEqual(snapshot(), first)
+        self.assertEqual(counts['users'], 23)
+        self.assertEqual(counts['order items'], len(first[3]))
+        self.assertEqual(Product.objects.values('category').distinct().count(), len(Product.CATEGORIES))
+        self.assertEqual(Order.objects.filter(status='cart').count(), 5)
+        self.assertFalse(Order.objects.filter(items__isnull=True).exists())
+        self.assertFalse(Product.objects.filter(created_at__gt=END).exists())
+        self.assertEqual(CatalogFacet.objects.aggregate(total=Sum('count'))['total'], counts['products'])
+
+    def test_order_totals_match_their_lines(self):
+        generate(seed=3, **SIZES)
+        line_totals = {
+            row['order']: row['total'] for row in
+            OrderItem.objects.values('order').annotate(total=Sum(F('price') * F('quantity')))
+        }
+        self.assertEqual(dict(Order.objects.values_list('id', 'total_price')), line_totals)
+
+    def test_carts_hold_their_lines(self):
+        counts = generate(seed=3, **SIZES)
+        lines = OrderItem.objects.filter(order__status='cart')
+        holds = StockHold.objects.all()
+        self.assertEqual(counts['stock holds'], lines.count())
+        self.assertEqual(
+            set(holds.values_list('order', 'product', 'quantity')),
+            set(lines.values_list('order', 'product', 'quantity')),
+        )
+        self.assertFalse(holds.exclude(order__status='cart').exists())
+
+    def test_no_products_means_no_orders(self):
+        with self.assertRaisesMessage(CommandError, 'at least one product'):
+            call_command('generate_dataset', '--products', '0', '--farmers', '1', '--customers', '1')
+        counts = generate(seed=3, **dict(SIZES, products=0, orders=0, carts=0))
+        self.assertEqual((counts['products'], counts['orders']), (0, 0))
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, ALLOWED_HOSTS=['localhost'])
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate(seed=5, **dict(SIZES, products=300))
+        Product.objects.update(stock=500)
+
+    def test_every_flow_runs_cleanly(self):
+        report = run(list(FLOWS), concurrency=1, iterations=2)
+
+        results = report['results']
+        self.assertEqual(set(results), {
+            'view_products', 'product_detail', 'add_to_cart', 'cart_view', 'checkout_form', 'checkout', 'login_view',
+        })
+        for label, stats in results.items():
+            with self.subTest(label=label):
+                self.assertEqual(stats['errors'], 0)
+                self.assertLessEqual(stats['p50_ms'], stats['p95_ms'])
+                self.assertLessEqual(stats['p95_ms'], stats['p99_ms'])
+                self.assertIsNotNone(stats['queries_per_request'])
+        self.assertEqual(Order.objects.filter(status='pending', updated_at__gte=END).count(), 2)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'results': {'checkout': {'p95_ms': 100, 'p99_ms': 120, 'throughput': 50, 'queries_per_request': 7}}}
+        current = {'results': {'checkout': {'p95_ms': 105, 'p99_ms': 200, 'throughput': 30, 'queries_per_request': 8}}}
+
+        regressed = {metric for _, metric, _, _, _, bad in compare(current, baseline, threshold=10) if bad}
+        self.assertEqual(regressed, {'p99_ms', 'throughput', 'queries_per_request'})
+
+    def test_unknown_flows_are_rejected(self):
+        with self.assertRaisesMessage(CommandError, 'Unknown flow(s): nope'):
+            call_command('benchmark', 'browse', 'nope')
+        with self.assertRaisesMessage(CommandError, 'Unknown profile(s): wal'):
+            call_command('benchmark_writes', 'wal')
+
+    def test_in_process_errors_are_recorded_as_500(self):
+        cache.clear()
+        session = InProcessSession()
+        with patch('products.views.catalog_facets', side_effect=RuntimeError('boom')), self.assertLogs('django.request', 'ERROR'):
+            status, _ = session.request('get', reverse('view_products'))
+        self.assertEqual(status, 500)
+        self.assertIsInstance(session.error, RuntimeError)
+
+
+class HttpSessionTests(LiveServerTestCase):
+    def test_redirects_are_not_followed(self):
+        session = HttpSession(self.live_server_url)
+        self.assertEqual(session.request('get', reverse('add_product')), (302, None))
+        self.assertEqual(session.request('post', reverse('login'), {'email': 'nobody@example.com', 'password': 'pw'})[0], 302)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class RequestTimingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate(seed=9, **SIZES)
+
+    def setUp(self):
+        cache.clear()  # measure the view, not a page cache hit
+
+    @override_settings(REQUEST_TIMING=True, REQUEST_TIMING_SLOW_MS=60000)
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs('perf.requests', 'INFO') as logs:
+            response = self.client.get(reverse('view_products'))
+
+        timings = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timings), {'db', 'tpl', 'view', 'total'})
+        self.assertEqual(len(logs.records), 1)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], reverse('view_products'))
+        self.assertIsNotNone(record['view'])
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        self.assertIn(f'desc="{record["queries"]} queries"', timings['db'])
+        self.assertGreater(record['template_ms'], 0)
+        self.assertLessEqual(record['template_ms'], record['view_ms'])
+        self.assertLessEqual(record['view_ms'], record['total_ms'])
+
+    @override_settings(REQUEST_TIMING=True, REQUEST_TIMING_SLOW_MS=0, REQUEST_TIMING_SLOW_SAMPLE_RATE=1.0)
+    def test_slow_requests_log_their_queries(self):
+        with self.assertLogs('perf.requests', 'WARNING') as logs:
+            self.client.get(reverse('view_products'))
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(len(record['sql']), record['queries'])
+        self.assertTrue(any('products_product' in query['sql'] for query in record['sql']))
+
+    @override_settings(REQUEST_TIMING=False)
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('view_products'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PROFILE_DIR=os.path.join(TEST_MEDIA_ROOT, 'profiles'))
+class ProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate(seed=9, **SIZES)
+        cls.staff = User.objects.create_user(username='ops', email='ops@example.com', password='pw', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def profile_path(self, response):
+        self.assertTrue(response.has_header('X-Profile-Url'))
+        name = response['X-Profile-Url'].rsplit('/', 1)[1]
+        return os.path.join(TEST_MEDIA_ROOT, 'profiles', name), response['X-Profile-Url']
+
+    def test_staff_cprofile(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('view_products'), {'profile': '1', 'sort': 'price_asc'})
+
+        self.assertEqual(response.status_code, 200)
+        path, url = self.profile_path(response)
+        self.assertTrue(path.endswith('.prof'))
+        functions = {name for _, _, name in pstats.Stats(path).stats}
+        self.assertIn('view_products', functions)
+
+        download = self.client.get(url)
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('attachment', download['Content-Disposition'])
+
+    def test_staff_sampling_profile_by_header(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('view_products'), headers={'X-Profile': 'sample'})
+
+        path, _ = self.profile_path(response)
+        self.assertTrue(path.endswith('.collapsed'))
+        with open(path) as collapsed:
+            for line in collapsed:
+                self.assertRegex(line, r'^\S.* \d+$')
+
+    def test_everyone_else_is_ignored(self):
+        response = self.client.get(reverse('view_products'), {'profile': '1'})
+        self.assertFalse(response.has_header('X-Profile-Url'))
+
+        customer = User.objects.filter(role='customer').first()
+        self.client.force_login(customer)
+        response = self.client.get(reverse('view_products'), {'profile': '1'})
+        self.assertFalse(response.has_header('X-Profile-Url'))
+
+    def test_download_is_staff_only(self):
+        self.client.force_login(self.staff)
+        _, url = self.profile_path(self.client.get(reverse('view_products'), {'profile': '1'}))
+        self.client.logout()
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class SQLiteProfileTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_production_pragmas_apply_to_new_connections(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 20000)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_write_benchmark(self):
+        report = run_write_benchmark(processes=2, iterations=2, products=10)
+
+        self.assertEqual(set(report['results']), {'rollback', 'production'})
+        production = report['results']['production']
+        self.assertEqual(production['checkouts'], 4)
+        for label, stats in production['requests'].items():
+            with self.subTest(profile='production', label=label):
+                self.assertEqual(stats['errors'], 0)
+                self.assertEqual(stats['locked'], 0)
+        # Deferred transactions may fail to upgrade a read lock when another
+        # process writes first; those locks are the only failures allowed
+        for label, stats in report['results']['rollback']['requests'].items():
+            with self.subTest(profile='rollback', label=label):
+                self.assertEqual(stats['errors'], stats['locked'])
+
+
+class SQLiteCheckpointTests(TransactionTestCase):
+    # A checkpoint cannot run inside the transaction TestCase wraps each test in
+
+    def test_checkpoint_and_vacuum(self):
+        out = StringIO()
+        call_command('sqlite_checkpoint', '--vacuum', stdout=out)
+        self.assertIn('WAL frames', out.getvalue())
+        self.assertIn('KiB -> 0 KiB, vacuumed', out.getvalue())
+
+
+@override_settings(REPLICA_READS=True, REPLICA_STICKY_SECONDS=30)
+class ReplicaRoutingTests(TransactionTestCase):
+    # The replica mirrors the test database; a TestCase's uncommitted rows would be invisible to it
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        farmer = User.objects.create_user(username='farmer', email='farmer@example.com', password='pw', role='farmer')
+        self.customer = User.objects.create_user(username='customer', email='customer@example.com', password='pw')
+        self.product = Product.objects.create(
+            user=farmer, name='Tomato', description='Fresh red tomatoes', price=10, stock=50,
+            category='vegetable', image='product_images/tomato.jpg',
+        )
+        self.client.force_login(self.customer)
+
+    def get(self, url):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return replica.captured_queries
+
+    def test_catalog_pages_read_products_from_the_replica(self):
+        for url in (reverse('home'), reverse('products'), reverse('product_detail', args=[self.product.id])):
+            with self.subTest(url=url):
+                cache.clear()
+                queries = self.get(url)
+                self.assertTrue(queries)
+                self.assertTrue(all('products_product' in q['sql'] or 'catalog' in q['sql'] for q in queries))
+
+    def test_other_pages_stay_on_the_primary(self):
+        self.assertEqual(self.get(reverse('profile')), [])
+
+    def test_session_is_pinned_to_the_primary_after_a_write(self):
+        self.client.post(reverse('add_to_cart', args=[self.product.id]), {'quantity': 1})
+        self.assertEqual(self.get(reverse('products')), [])
+
+        session = self.client.session
+        session[STICKY_SESSION_KEY] = 0
+        session.save()
+        cache.clear()
+        self.assertTrue(self.get(reverse('products')))
+
+    def test_failed_writes_do_not_pin_the_session(self):
+        self.assertEqual(self.client.post(reverse('add_to_cart', args=[0]), {'quantity': 1}).status_code, 404)
+        self.assertNotIn(STICKY_SESSION_KEY, self.client.session)
+        self.assertTrue(self.get(reverse('products')))
+
+    def test_writes_always_go_to_the_primary(self):
+        product = Product.objects.using('replica').get(id=self.product.id)
+        self.assertEqual(product._state.db, 'replica')
+        self.assertEqual(router.db_for_write(Product, instance=product), 'default')
+        self.assertEqual(router.db_for_read(User, instance=product), 'default')
+
+
+class SyncReplicaTests(TransactionTestCase):
+    def test_sync_copies_the_primary(self):
+        User.objects.create_user(username='farmer', email='farmer@example.com', password='pw', role='farmer')
+        target = os.path.join(tempfile.mkdtemp(), 'replica.sqlite3')
+        self.addCleanup(shutil.rmtree, os.path.dirname(target))
+
+        out = StringIO()
+        call_command('sync_replica', '--to', target, stdout=out)
+        self.assertIn('Synced', out.getvalue())
+        with sqlite3.connect(target) as replica:
+            rows = replica.execute(f'SELECT username FROM {User._meta.db_table}').fetchall()
+        self.assertEqual(rows, [('farmer',)])
+
+    def test_open_replica_connections_see_the_next_sync(self):
+        User.objects.create_user(username='farmer', email='farmer@example.com', password='pw', role='farmer')
+        target = os.path.join(tempfile.mkdtemp(), 'replica.sqlite3')
+        self.addCleanup(shutil.rmtree, os.path.dirname(target))
+        call_command('sync_replica', '--to', target, stdout=StringIO())
+
+        # Like the replica alias's connection, held open across syncs
+        replica = sqlite3.connect(target)
+        self.addCleanup(replica.close)
+        replica.execute('PRAGMA query_only = ON')
+        count = f'SELECT COUNT(*) FROM {User._meta.db_table}'
+        self.assertEqual(replica.execute(count).fetchone(), (1,))
+
+        User.objects.create_user(username='customer', email='customer@example.com', password='pw')
+        call_command('sync_replica', '--to', target, stdout=StringIO())
+        self.assertEqual(replica.execute(count).fetchone(), (2,))
+
+    def test_refuses_to_overwrite_the_primary(self):
+        with self.assertRaisesMessage(CommandError, 'is the primary'):
+            call_command('sync_replica')
@@ -0,0 +1,7 @@
+from django.urls import re_path
+from . import views
+app_name = 'perf'
+
+urlpatterns = [
+    re_path(r'^profiles/(?P<name>[\w-]+\.(?:prof|collapsed))$', views.profile_file, name='profile_file'),
+]
@@ -0,0 +1,15 @@
+import os
+
+from django.http import FileResponse, Http404
+
+from .profiler import profile_dir
+
+
+def profile_file(request, name):
+    """Download a profile written by ProfilerMiddleware; staff only."""
+    path = os.path.join(profile_dir(), name)
+    if not request.user.is_staff or not os.path.isfile(path):
+        raise Http404
+    if name.endswith('.collapsed'):
+        return FileResponse(open(path, 'rb'), content_type='text/plain; charset=utf-8')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
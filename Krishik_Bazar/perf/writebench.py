@@ -0,0 +1,183 @@
+"""Multi-process write benchmark for the SQLite connection settings.
+
+Several OS processes, like several gunicorn workers, each log in as their own
+customer and then repeatedly add a product to the cart and check out through
+the real views, all against one database file. The run is repeated for each
+connection profile, each time on a fresh copy of the same small seeded
+database:
+
+* ``rollback``: Django's SQLite defaults, i.e. a rollback journal, deferred
+  transactions and a 5 second timeout;
+* ``production``: the ``OPTIONS`` of ``settings.DATABASES['default']`` (WAL,
+  busy_timeout, immediate transactions).
+
+Requests that fail with "database is locked" are counted as errors and,
+separately, as ``locked``.
+Processes are started with ``spawn``: SQLite connections must not cross a fork.
+"""
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+
+from django.conf import settings
+
+ROLLBACK_PROFILE = {'init_command': 'PRAGMA journal_mode = DELETE'}
+PROFILES = ('rollback', 'production')
+LOCKED = 503  # status recorded for requests that failed on a database lock
+
+
+def profile_options(name):
+    if name == 'rollback':
+        return ROLLBACK_PROFILE
+    return settings.DATABASES['default'].get('OPTIONS', {})
+
+
+def _setup_django(path, options, media_root):
+    # Runs first thing in a spawned process, before any connection is opened
+    database = settings.DATABASES['default']
+    database['NAME'] = path
+    database['OPTIONS'] = options
+    settings.MEDIA_ROOT = media_root
+    import django
+    django.setup()
+
+
+def _seed(path, options, media_root, customers, products):
+    _setup_django(path, options, media_root)
+    from django.core.management import call_command
+    from django.db import connection
+    from django.utils import timezone
+    from products.models import Product
+    from .dataset import generate
+
+    call_command('migrate', verbosity=0)
+    generate(seed=1, farmers=2, customers=customers, products=products, orders=0, carts=0, end=timezone.now())
+    Product.objects.update(stock=10 ** 7)
+    # Leave a self-contained file behind, whatever journal the profiles then use
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode = DELETE')
+
+
+def _is_lock_error(error):
+    from django.db import OperationalError
+    return isinstance(error, OperationalError) and 'locked' in str(error)
+
+
+class _SkipLockErrors(logging.Filter):
+    # Recorded as LOCKED samples instead of logged as server errors
+    def filter(self, record):
+        return not (record.exc_info and _is_lock_error(record.exc_info[1]))
+
+
+def _worker(path, options, media_root, index, iterations, barrier, results):
+    try:
+        _setup_django(path, options, media_root)
+        from django.urls import reverse
+        from products.models import Product
+        from .benchmark import CHECKOUT_FORM, InProcessSession, _login
+        from .dataset import EMAIL_DOMAIN
+
+        logging.getLogger('django.request').addFilter(_SkipLockErrors())
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        session = InProcessSession()
+        rng = random.Random(index)
+        for attempt in range(5):
+            _login(session, f'customer{index:06d}@{EMAIL_DOMAIN}')
+            if not _is_lock_error(session.error):
+                break
+            time.sleep(0.1 * (attempt + 1))
+        barrier.wait()
+
+        samples = []
+        for _ in range(iterations):
+            steps = (
+                ('add_to_cart', reverse('add_to_cart', args=[rng.choice(product_ids)]), {'quantity': 1}),
+                ('checkout', reverse('payment:checkout'), CHECKOUT_FORM),
+            )
+            for label, url, data in steps:
+                started = time.perf_counter()
+                status, queries = session.request('post', url, data)
+                if _is_lock_error(session.error):
+                    status, queries = LOCKED, None
+                samples.append((label, (time.perf_counter() - started) * 1000, status, queries))
+        results.put((index, samples, None))
+    except Exception:
+        results.put((index, None, traceback.format_exc()))
+        barrier.abort()
+
+
+def _run_profile(context, path, options, media_root, processes, iterations):
+    barrier = context.Barrier(processes + 1)
+    results = context.Queue()
+    workers = [
+        context.Process(target=_worker, args=(path, options, media_root, index, iterations, barrier, results))
+        for index in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        barrier.wait()
+        started = time.perf_counter()
+    except threading.BrokenBarrierError:
+        started = None  # a process failed while setting up
+    # Every process reports exactly once, with its samples or its traceback
+    collected = [results.get(timeout=600) for _ in workers]
+    elapsed = time.perf_counter() - started if started else None
+    for worker in workers:
+        worker.join()
+    for _, _, error in collected:
+        if error:
+            raise RuntimeError(f"A benchmark process failed:\n{error}")
+    return [sample for _, samples, _ in collected for sample in samples], elapsed
+
+
+def run(processes=4, iterations=25, profiles=PROFILES, products=200, log=None):
+    """Run the write benchmark once per profile and return a JSON-serialisable report."""
+    from .benchmark import summarize
+
+    log = log or (lambda message: None)
+    context = multiprocessing.get_context('spawn')
+    workdir = tempfile.mkdtemp(prefix='krishik-writebench-')
+    media_root = os.path.join(workdir, 'media')
+    seeded = os.path.join(workdir, 'seed.sqlite3')
+    report = {
+        'meta': {'processes': processes, 'iterations': iterations, 'products': products},
+        'results': {},
+    }
+    try:
+        log("Seeding...")
+        seeder = context.Process(
+            target=_seed, args=(seeded, profile_options('production'), media_root, processes, products),
+        )
+        seeder.start()
+        seeder.join()
+        if seeder.exitcode:
+            raise RuntimeError("Seeding the benchmark database failed.")
+
+        for name in profiles:
+            log(f"Running {name}...")
+            path = os.path.join(workdir, f'{name}.sqlite3')
+            shutil.copyfile(seeded, path)
+            samples, elapsed = _run_profile(context, path, profile_options(name), media_root, processes, iterations)
+            by_label = {}
+            for label, ms, status, queries in samples:
+                by_label.setdefault(label, []).append((ms, status, queries))
+            stats = {label: summarize(values, elapsed) for label, values in by_label.items()}
+            for label, values in by_label.items():
+                stats[label]['locked'] = sum(1 for _, status, _ in values if status == LOCKED)
+            checkouts = sum(1 for label, _, status, _ in samples if label == 'checkout' and status < 400)
+            report['results'][name] = {
+                'elapsed_s': round(elapsed, 3),
+                'checkouts': checkouts,
+                'checkouts_per_second': round(checkouts / elapsed, 2) if elapsed else None,
+                'requests': stats,
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
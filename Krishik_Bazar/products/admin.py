@@ -1,4 +1,35 @@
 from django.contrib import admin
-from .models import Product
+from django.db import transaction
+from .models import Product, StockMovement
+from .stock import set_stock
 
-admin.site.register(Product)
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # Like the farmer's edit form: stock through set_stock, so the version is bumped
+        # and the change journaled, the rest by save()
+        fields = [name for name in form.changed_data if name != 'stock'] + ['updated_at']
+        with transaction.atomic():
+            if 'stock' in form.changed_data:
+                obj.stock = set_stock(obj.id, obj.stock)
+            obj.save(update_fields=fields)
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'product', 'delta', 'reason', 'order')
+    list_filter = ('reason',)
+    raw_id_fields = ('product', 'order')
+
+    # The ledger is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def _install_search_index(sender, using='default', **kwargs):
+    from .search import install_search_index
+    install_search_index(using)
 
 
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Migrations that remake products_product drop the FTS triggers; restore them
+        post_migrate.connect(_install_search_index, sender=self)
@@ -0,0 +1,94 @@
+"""Read model for product lists.
+
+List pages show a card per product: name, price, stock, picture and a short
+excerpt of the description. ``as_cards`` turns a product queryset into one
+that selects just those columns plus the first few hundred characters of the
+description, and yields small ``ProductCard`` objects instead of model
+instances. Filtering, ordering, slicing and both paginators keep working on it.
+"""
+import json
+
+from django.db.models import TextField
+from django.db.models.fields.files import FieldFile
+from django.db.models.functions import Cast, Substr
+from django.db.models.query import ValuesIterable
+
+from .models import Product
+
+CARD_COLUMNS = ('id', 'name', 'price', 'stock', 'version', 'category', 'image', 'created_at', 'updated_at')
+EXCERPT_WORDS = 15
+# Enough characters for EXCERPT_WORDS words of ordinary text
+EXCERPT_CHARS = 200
+IMAGE_FIELD = Product._meta.get_field('image')
+
+
+def make_excerpt(source):
+    """
+    ``truncatewords:15`` of a description, given only its first
+    EXCERPT_CHARS + 1 characters. Text whose first 15 words run longer than
+    that is cut at EXCERPT_CHARS instead, so no card carries an unbounded excerpt.
+    """
+    if len(source) <= EXCERPT_CHARS:
+        words = source.split()
+        if len(words) <= EXCERPT_WORDS:
+            return ' '.join(words)
+        return ' '.join(words[:EXCERPT_WORDS]) + ' …'
+    words = source[:EXCERPT_CHARS].split()
+    if len(words) > 1 and not source[EXCERPT_CHARS - 1].isspace() and not source[EXCERPT_CHARS].isspace():
+        words.pop()  # the cut split this word
+    return ' '.join(words[:EXCERPT_WORDS]) + ' …'
+
+
+class ProductCard:
+    __slots__ = CARD_COLUMNS + ('excerpt', 'description', 'search_rank', '_derivatives')
+
+    def __init__(self, *, image, excerpt_source, derivatives_json, description=None, search_rank=None, **columns):
+        for name, value in columns.items():
+            setattr(self, name, value)
+        # Templates and product_picture expect a FieldFile; it needs no model instance for url/storage
+        self.image = FieldFile(None, IMAGE_FIELD, image)
+        self.excerpt = make_excerpt(excerpt_source)
+        self.description = description
+        self.search_rank = search_rank
+        self._derivatives = derivatives_json
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def image_derivatives(self):
+        # Decoded on first use: cards served from the fragment cache never need it
+        if isinstance(self._derivatives, str):
+            self._derivatives = json.loads(self._derivatives)
+        return self._derivatives or {}
+
+    def __repr__(self):
+        return f'<ProductCard {self.id}: {self.name}>'
+
+
+class CardIterable(ValuesIterable):
+    def __iter__(self):
+        for row in super().__iter__():
+            yield ProductCard(**row)
+
+
+def as_cards(queryset, with_description=False):
+    """``queryset`` narrowed to the card columns, yielding ProductCard objects.
+
+    ``with_description`` also loads the full description, for the farmer's own
+    listing where the edit form is prefilled from it.
+    """
+    columns = list(CARD_COLUMNS)
+    if with_description:
+        columns.append('description')
+    if 'search_rank' in queryset.query.annotations:
+        columns.append('search_rank')
+    cards = queryset.values(
+        *columns,
+        # One character past the excerpt tells whether the description goes on
+        excerpt_source=Substr('description', 1, EXCERPT_CHARS + 1, output_field=TextField()),
+        derivatives_json=Cast('image_derivatives', TextField()),
+    )
+    cards._iterable_class = CardIterable
+    return cards
@@ -0,0 +1,143 @@
+"""Category counts and a price histogram for the catalog filters.
+
+Both come from the same numbers: how many products fall in each
+(category, price bucket). For the unfiltered catalog those live in the
+``CatalogFacet`` summary table, which product signals keep current with one
+upsert per write. For a search the counts come from one grouped query over the
+matches. Either way the result is cached until the next product write, so a
+page view normally reads facets from the cache alone.
+"""
+import hashlib
+from bisect import bisect_right
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .models import CatalogFacet, Product
+from .search import search_products
+
+# Lower bounds of the price histogram buckets, in NPR
+PRICE_BUCKETS = (0, 50, 100, 250, 500, 1000, 2500)
+GENERATION_KEY = 'facets:generation'
+
+
+def price_floor(price):
+    # Views assign prices as floats or strings before saving
+    return PRICE_BUCKETS[max(bisect_right(PRICE_BUCKETS, Decimal(str(price))) - 1, 0)]
+
+
+def price_floor_expression():
+    """SQL equivalent of ``price_floor``."""
+    return Case(
+        *[When(price__lt=upper, then=Value(lower)) for lower, upper in zip(PRICE_BUCKETS, PRICE_BUCKETS[1:])],
+        default=Value(PRICE_BUCKETS[-1]),
+        output_field=IntegerField(),
+    )
+
+
+def _bump_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def purge_facet_cache():
+    """Drop every cached facet count."""
+    _bump_generation()
+
+
+def facet_generation():
+    return cache.get_or_set(GENERATION_KEY, 1, None)
+
+
+def record_product_change(old=None, new=None, text_changed=False):
+    """Move one product between (category, price) cells of the summary table.
+
+    ``old``/``new`` are (category, price) before and after the write, None for
+    a create or delete. Cached facets are dropped if a cell changed or, since
+    it changes what searches match, the name or description did.
+    """
+    deltas = {}
+    if old is not None:
+        key = (old[0], price_floor(old[1]))
+        deltas[key] = deltas.get(key, 0) - 1
+    if new is not None:
+        key = (new[0], price_floor(new[1]))
+        deltas[key] = deltas.get(key, 0) + 1
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas and not text_changed:
+        return
+    using = router.db_for_write(CatalogFacet)
+    if deltas:
+        connection = connections[using]
+        table = connection.ops.quote_name(CatalogFacet._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (category, price_floor, count) VALUES '
+                + ', '.join(['(%s, %s, %s)'] * len(deltas))
+                + f' ON CONFLICT (category, price_floor) DO UPDATE SET count = {table}.count + excluded.count',
+                [value for (category, floor), delta in deltas.items() for value in (category, floor, delta)],
+            )
+    _bump_generation()
+    # Again after commit, for facets cached from pre-commit data in between
+    transaction.on_commit(_bump_generation, using=using)
+
+
+def rebuild_facets():
+    """Recount the summary table from the products; returns the number of cells."""
+    cells = [
+        CatalogFacet(category=row['category'], price_floor=row['floor'], count=row['count'])
+        for row in Product.objects.order_by().values('category', floor=price_floor_expression()).annotate(count=Count('id'))
+    ]
+    with transaction.atomic():
+        CatalogFacet.objects.all().delete()
+        CatalogFacet.objects.bulk_create(cells)
+    _bump_generation()
+    return len(cells)
+
+
+def _cell_counts(search_query):
+    if not search_query:
+        return {(facet.category, facet.price_floor): facet.count for facet in CatalogFacet.objects.filter(count__gt=0)}
+    matches = search_products(Product.objects.all(), search_query).order_by()
+    return {
+        (row['category'], row['floor']): row['count']
+        for row in matches.values('category', floor=price_floor_expression()).annotate(count=Count('id'))
+    }
+
+
+def cell_counts(search_query=None):
+    """{(category, price floor): product count} for the whole catalog or a search."""
+    normalized = ' '.join((search_query or '').lower().split())
+    key = f'facets:{facet_generation()}:{hashlib.sha1(normalized.encode()).hexdigest()}'
+    counts = cache.get(key)
+    if counts is None:
+        counts = _cell_counts(normalized)
+        cache.set(key, counts, getattr(settings, 'FACET_CACHE_TIMEOUT', 600))
+    return counts
+
+
+def catalog_facets(search_query=None, category_filter=None):
+    """Category counts for ``search_query`` and its price histogram within ``category_filter``."""
+    counts = cell_counts(search_query)
+    categories = [
+        (code, label, sum(n for (category, _), n in counts.items() if category == code))
+        for code, label in Product.CATEGORIES
+    ]
+    histogram = []
+    for lower, upper in zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + (None,)):
+        count = sum(n for (category, floor), n in counts.items()
+                    if floor == lower and (not category_filter or category == category_filter))
+        histogram.append({'low': lower, 'high': upper, 'count': count})
+    largest = max(bucket['count'] for bucket in histogram) or 1
+    for bucket in histogram:
+        bucket['percent'] = round(bucket['count'] * 100 / largest)
+    return {
+        'categories': categories,
+        'total': sum(counts.values()),
+        'prices': histogram,
+    }
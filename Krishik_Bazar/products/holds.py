@@ -0,0 +1,84 @@
+"""Time-limited stock reservations for carts.
+
+Adding to a cart places a ``StockHold`` on the line's quantity for
+``STOCK_HOLD_SECONDS``; every further change to the cart renews the holds in
+it. Available to sell is the product's stock less the unexpired holds of
+other carts, summed from the ``stock_hold_active_idx`` index, never from the
+carts themselves. Checkout (``products.stock.take_stock``) only succeeds
+against that same number and then drops the order's holds, which turns the
+reservation into the sale.
+
+Expired holds are simply ignored, so a cart abandoned past its TTL frees its
+units at once; ``manage.py release_expired_holds`` deletes them in bulk to
+keep the index small. Reserving reads and then writes; SQLite's immediate
+transactions serialize the two. Checkout's guarded UPDATE is the final word
+on overselling either way.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, StockHold
+
+
+class HoldRefused(Exception):
+    """Fewer units than asked for are free to reserve."""
+
+    def __init__(self, available):
+        self.available = available
+        super().__init__(f'{available} available')
+
+
+def _expiry():
+    return timezone.now() + timedelta(seconds=getattr(settings, 'STOCK_HOLD_SECONDS', 900))
+
+
+def held_by_others(order=None):
+    """Expression for a product's units held by unexpired holds of carts other than ``order``."""
+    holds = StockHold.objects.filter(product=OuterRef('pk'), expires_at__gt=timezone.now())
+    if order is not None:
+        holds = holds.exclude(order=order)
+    held = holds.order_by().values('product').annotate(held=Sum('quantity')).values('held')
+    return Coalesce(Subquery(held), 0)
+
+
+def available_to_sell(product_ids, order=None):
+    """{product id: stock less what other carts hold} for ``order``'s point of view."""
+    return dict(
+        Product.objects.filter(id__in=product_ids)
+        .annotate(available=F('stock') - held_by_others(order))
+        .values_list('id', 'available')
+    )
+
+
+def reserve(order, product_id, quantity):
+    """Hold ``quantity`` units (the cart line's new total) for ``order``, renewing its other holds.
+
+    Raises HoldRefused, with the units that could be held, if there are not
+    enough. Call inside a transaction, with the cart line change it is for.
+    """
+    available = available_to_sell([product_id], order).get(product_id, 0)
+    if quantity > available:
+        raise HoldRefused(max(available, 0))
+    expires_at = _expiry()
+    StockHold.objects.bulk_create(
+        [StockHold(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)],
+        update_conflicts=True, unique_fields=['order', 'product'], update_fields=['quantity', 'expires_at'],
+    )
+    StockHold.objects.filter(order=order).exclude(product_id=product_id).update(expires_at=expires_at)
+
+
+def release(order, product_id=None):
+    """Drop ``order``'s hold on one product, or all of them."""
+    holds = StockHold.objects.filter(order=order)
+    if product_id is not None:
+        holds = holds.filter(product_id=product_id)
+    holds.delete()
+
+
+def release_expired():
+    """Delete every expired hold; returns how many there were."""
+    return StockHold.objects.filter(expires_at__lte=timezone.now()).delete()[0]
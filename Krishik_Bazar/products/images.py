@@ -0,0 +1,105 @@
+"""Fixed-size, recompressed derivatives of uploaded product images.
+
+Every product image gets a WebP and a JPEG rendition of each size below, at
+1x and 2x widths, stored next to the original under ``derivatives/``. Like
+the originals they are named after their content, so identical renditions of
+different uploads share one blob. The generated names are recorded on
+``Product.image_derivatives`` so templates can build ``srcset`` attributes
+without touching storage.
+"""
+import logging
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .storage import is_content_addressed
+
+logger = logging.getLogger(__name__)
+
+# kind -> (widths, aspect ratio to crop to, or None to keep the original ratio)
+DERIVATIVE_SIZES = {
+    'thumb': ((64, 128), 1.0),        # cart, checkout and dashboard thumbnails
+    'card': ((320, 640), 4 / 3),      # catalog and home product cards
+    'detail': ((600, 1200), None),    # product detail page
+}
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def derivative_upload_name(source_name, fmt):
+    # Only the directory and extension matter: the storage names the blob after its digest
+    directory = posixpath.dirname(source_name)
+    if is_content_addressed(source_name):
+        directory = posixpath.dirname(directory)  # drop the <aa>/ shard
+    return posixpath.join(directory, 'derivatives', f'derivative.{fmt}')
+
+
+def _render(image, width, ratio, fmt):
+    if ratio is None:
+        resized = image.copy()
+        resized.thumbnail((width, width * 4), Image.LANCZOS)
+    else:
+        resized = ImageOps.fit(image, (width, round(width / ratio)), Image.LANCZOS)
+    pil_format, options = FORMATS[fmt]
+    buffer = BytesIO()
+    resized.save(buffer, pil_format, **options)
+    return buffer.getvalue(), resized.size
+
+
+def generate_derivatives(image_file):
+    """Write every derivative of ``image_file`` (a FieldFile) and return their description.
+
+    Only the source name is recorded if the file is missing or is not a
+    readable image, so it is not retried on every save.
+    """
+    storage = image_file.storage
+    if not storage.exists(image_file.name):
+        logger.info("Product image %s is missing, skipping derivatives", image_file.name)
+        return {'source': image_file.name}
+    try:
+        with image_file.open('rb') as source:
+            image = Image.open(source)
+            image = ImageOps.exif_transpose(image)
+            image = image.convert('RGB')
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        logger.warning("Could not read product image %s", image_file.name, exc_info=True)
+        return {'source': image_file.name}
+
+    derivatives = {'source': image_file.name}
+    for kind, (widths, ratio) in DERIVATIVE_SIZES.items():
+        variants = derivatives[kind] = {fmt: [] for fmt in FORMATS}
+        for width in widths:
+            for fmt in FORMATS:
+                data, (actual_width, _) = _render(image, width, ratio, fmt)
+                if any(w == actual_width for _, w in variants[fmt]):
+                    continue  # small source: the larger width would just repeat the smaller one
+                name = storage.save(derivative_upload_name(image_file.name, fmt), ContentFile(data))
+                variants[fmt].append([name, actual_width])
+    return derivatives
+
+
+def derivative_names(derivatives):
+    for kind in DERIVATIVE_SIZES:
+        for variants in derivatives.get(kind, {}).values():
+            for name, _ in variants:
+                yield name
+
+
+def derivatives_are_current(product):
+    return bool(product.image) and product.image_derivatives.get('source') == product.image.name
+
+
+def srcset(product, kind, fmt):
+    """``srcset`` value for one derivative kind and format, or '' if not generated yet."""
+    if not derivatives_are_current(product):
+        return ''
+    storage = product.image.storage
+    return ', '.join(
+        f'{storage.url(name)} {width}w'
+        for name, width in product.image_derivatives.get(kind, {}).get(fmt, [])
+    )
@@ -0,0 +1,20 @@
+from django.core.files.storage import default_storage
+
+from jobs.queue import job
+from .models import Product
+from .signals import refresh_image_derivatives
+from .storage import release_image
+
+
+@job
+def refresh_product_image_derivatives(product_id):
+    """Resize a product's uploaded image; queued from the save signal."""
+    product = Product.objects.filter(pk=product_id).only('id', 'image', 'image_derivatives').first()
+    if product is not None:
+        refresh_image_derivatives(product)
+
+
+@job
+def release_product_image(name, derivatives):
+    """Delete an image blob no product uses any more, with its derivatives."""
+    release_image(default_storage, name, derivatives)
@@ -0,0 +1,94 @@
+"""Append-only journal of stock changes.
+
+Every write in ``products.stock`` appends ``StockMovement`` rows (sale,
+cancellation, restock, manual edit) in the same transaction, one
+``bulk_create`` per write however many products it touches. Movements are
+never updated.
+
+``compact`` runs periodically (``manage.py compact_stock_ledger``). It folds
+each product's new movements into a ``StockSnapshot`` and checks the result
+against ``Product.stock``. A difference means stock was changed outside the
+ledger (the admin, bulk loads); it is recorded as a ``correction`` movement,
+so the journal always adds up to the live stock.
+
+``Product.stock`` stays the live number that checkout decrements with a
+guarded UPDATE: it is what keeps concurrent checkouts from overselling, and
+what every page displays.
+"""
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Product, StockMovement, StockSnapshot
+
+
+def record(reason, deltas, order=None):
+    """Append one movement per {product id: delta}, skipping zeros."""
+    movements = [
+        StockMovement(product_id=product_id, delta=delta, reason=reason, order=order)
+        for product_id, delta in deltas.items() if delta
+    ]
+    if movements:
+        StockMovement.objects.bulk_create(movements)
+
+
+def _movement_sum(after, through=None):
+    movements = StockMovement.objects.filter(product=OuterRef('pk'), id__gt=after)
+    if through is not None:
+        movements = movements.filter(id__lte=through)
+    total = movements.order_by().values('product').annotate(total=Sum('delta')).values('total')
+    return Coalesce(Subquery(total), 0)
+
+
+def _compact_batch(after_product, through, batch_size):
+    latest = StockSnapshot.objects.filter(product=OuterRef('pk')).order_by('-through_movement')
+    rows = list(
+        Product.objects.filter(id__gt=after_product).order_by('id')
+        .annotate(
+            snapshot_stock=Subquery(latest.values('stock')[:1]),
+            snapshot_through=Coalesce(Subquery(latest.values('through_movement')[:1]), 0),
+        )
+        .annotate(
+            pending=_movement_sum(OuterRef('snapshot_through'), through),
+            # Appended since this run started; already part of Product.stock
+            later=_movement_sum(through),
+        )
+        .values_list('id', 'stock', 'snapshot_stock', 'pending', 'later')[:batch_size]
+    )
+    snapshots, corrections = [], {}
+    for product_id, stock, snapshot_stock, pending, later in rows:
+        folded = (snapshot_stock or 0) + pending
+        if snapshot_stock is None or pending:
+            snapshots.append(StockSnapshot(product_id=product_id, stock=folded, through_movement=through))
+        if stock != folded + later:
+            corrections[product_id] = stock - folded - later
+    StockSnapshot.objects.bulk_create(snapshots)
+    # After `through`, so the next run folds them like any other movement
+    record('correction', corrections)
+    return rows[-1][0] if rows else None, len(rows), len(snapshots), corrections
+
+
+def compact(batch_size=1000, prune_before=None):
+    """Fold movements into snapshots and reconcile them with Product.stock.
+
+    Products are processed ``batch_size`` at a time, each batch in its own
+    short transaction so checkouts are never held up for long. With
+    ``prune_before``, folded movements and superseded snapshots created
+    before that time are deleted afterwards. Returns counts of what was done.
+    """
+    through = StockMovement.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    summary = {'through_movement': through, 'products': 0, 'snapshots': 0, 'corrections': {}, 'pruned': 0}
+    last_product = 0
+    while last_product is not None:
+        with transaction.atomic():
+            last_product, products, snapshots, corrections = _compact_batch(last_product, through, batch_size)
+        summary['products'] += products
+        summary['snapshots'] += snapshots
+        summary['corrections'].update(corrections)
+
+    if prune_before is not None:
+        newer = StockSnapshot.objects.filter(product=OuterRef('product'), through_movement__gt=OuterRef('through_movement'))
+        with transaction.atomic():
+            summary['pruned'] = StockMovement.objects.filter(id__lte=through, created_at__lt=prune_before).delete()[0]
+            StockSnapshot.objects.filter(Exists(newer), created_at__lt=prune_before).delete()
+    return summary
@@ -0,0 +1,43 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from products.ledger import compact
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold stock movements into per-product snapshots and reconcile them with Product.stock, "
+        "once or every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Products per transaction.")
+        parser.add_argument('--prune-days', type=int,
+                            help="Also delete folded movements and superseded snapshots older than this many days.")
+        parser.add_argument('--interval', type=float, help="Keep running, compacting every this many seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            prune_before = None
+            if options['prune_days'] is not None:
+                prune_before = timezone.now() - timedelta(days=options['prune_days'])
+            started = time.perf_counter()
+            summary = compact(options['batch_size'], prune_before)
+            message = (
+                f"Checked {summary['products']} products through movement {summary['through_movement']}: "
+                f"{summary['snapshots']} new snapshots, {summary['pruned']} movements pruned "
+                f"in {time.perf_counter() - started:.1f}s"
+            )
+            if summary['corrections']:
+                drift = ', '.join(f'#{pid} {delta:+d}' for pid, delta in list(summary['corrections'].items())[:10])
+                self.stdout.write(self.style.WARNING(
+                    f"{message}; {len(summary['corrections'])} products changed outside the ledger ({drift})"
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(message))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
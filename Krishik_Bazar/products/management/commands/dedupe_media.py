@@ -0,0 +1,60 @@
+import posixpath
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from products.images import derivative_names
+from products.models import Product
+from products.signals import refresh_image_derivatives
+from products.storage import ContentAddressedStorage, content_digest, is_content_addressed
+
+
+class Command(BaseCommand):
+    help = "Move product images into content-addressed storage, merging byte-identical files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be merged.")
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError("The default storage is not ContentAddressedStorage.")
+        dry_run = options['dry_run']
+
+        # 1. Hash every legacy file once and move it to its content-addressed name
+        renamed = {}
+        for name in sorted(Product.objects.exclude(image='').values_list('image', flat=True).distinct()):
+            if is_content_addressed(name) or not default_storage.exists(name):
+                continue
+            with default_storage.open(name, 'rb') as source:
+                if dry_run:
+                    digest = content_digest(source)
+                    extension = posixpath.splitext(name)[1].lower()
+                    renamed[name] = posixpath.join(posixpath.dirname(name), digest[:2], digest + extension)
+                else:
+                    renamed[name] = default_storage.save(name, source)
+
+        blobs = set(renamed.values())
+        self.stdout.write(f"{len(renamed)} legacy file(s) map to {len(blobs)} distinct blob(s).")
+        if dry_run:
+            for old, new in renamed.items():
+                self.stdout.write(f"  {old} -> {new}")
+            return
+
+        # 2. Point products at the blobs, then reuse or regenerate derivatives
+        stale, live = set(), set()
+        for old, new in renamed.items():
+            for product in Product.objects.filter(image=old).only('id', 'image', 'image_derivatives'):
+                stale.update(derivative_names(product.image_derivatives))
+                Product.objects.filter(pk=product.pk).update(image=new)
+                product.image.name = new
+                refresh_image_derivatives(product)
+                live.update(derivative_names(product.image_derivatives))
+
+        # 3. Remove the legacy files and derivatives nothing points at any more
+        for name in list(renamed) + sorted(stale - live):
+            default_storage.delete(name)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {len(renamed)} file(s) into {len(blobs)} blob(s) and removed {len(stale - live)} stale derivative(s)."
+        ))
+
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+from products.signals import refresh_image_derivatives
+
+
+class Command(BaseCommand):
+    help = "Backfill resized WebP/JPEG derivatives for existing product images."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate derivatives that are already current.")
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').only('id', 'image', 'image_derivatives').order_by('id')
+        generated = failed = 0
+        for product in products.iterator(chunk_size=200):
+            previous = product.image_derivatives
+            refresh_image_derivatives(product, force=options['force'])
+            if product.image_derivatives is previous:
+                continue
+            if 'card' in product.image_derivatives:
+                generated += 1
+            else:
+                failed += 1
+                self.stderr.write(f"Could not read image for product {product.id}: {product.image.name}")
+        self.stdout.write(self.style.SUCCESS(f"Generated derivatives for {generated} product(s), {failed} failed."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.facets import rebuild_facets
+
+
+class Command(BaseCommand):
+    help = "Recount the catalog facet summary table (category and price bucket counts) from the products table."
+
+    def handle(self, *args, **options):
+        cells = rebuild_facets()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {cells} facet cells."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.search import FTS_TABLE, rebuild_search_index, search_index_available
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text product search index from the products table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not search_index_available(using):
+            raise CommandError("The full-text search index is only available on SQLite.")
+        rebuild_search_index(using)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {FTS_TABLE}."))
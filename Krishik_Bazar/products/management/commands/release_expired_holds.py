@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.holds import release_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired cart stock holds, once or every --interval seconds."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help="Keep running, sweeping every this many seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired()
+            self.stdout.write(self.style.SUCCESS(f"Released {released} expired holds."))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from products.stock import conflict_metrics
+
+
+class Command(BaseCommand):
+    help = "Show stock write attempts, conflict rates and shortfalls per operation, as counted in the cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help="Print the metrics as JSON.")
+
+    def handle(self, *args, **options):
+        metrics = conflict_metrics()
+        if options['json']:
+            self.stdout.write(json.dumps(metrics, indent=2))
+            return
+        if not metrics:
+            self.stdout.write("No stock writes recorded yet.")
+        for operation, counts in metrics.items():
+            self.stdout.write(
+                f"{operation}: {counts['attempts']} attempts, {counts['conflicts']} conflicts "
+                f"({counts['conflict_rate']:.1%}), {counts['shortfalls']} short of stock, {counts['exhausted']} gave up"
+            )
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:01
+
+from bisect import bisect_right
+from collections import Counter
+
+from django.db import migrations, models
+
+# Copied from products.facets as it stood when this migration was written
+PRICE_BUCKETS = (0, 50, 100, 250, 500, 1000, 2500)
+
+
+def price_floor(price):
+    return PRICE_BUCKETS[max(bisect_right(PRICE_BUCKETS, price) - 1, 0)]
+
+
+def count_existing_products(apps, schema_editor):
+    using = schema_editor.connection.alias
+    Product = apps.get_model('products', 'Product')
+    CatalogFacet = apps.get_model('products', 'CatalogFacet')
+    cells = Counter(
+        (category, price_floor(price))
+        for category, price in Product.objects.using(using).values_list('category', 'price').iterator()
+    )
+    CatalogFacet.objects.using(using).bulk_create(
+        CatalogFacet(category=category, price_floor=floor, count=count) for (category, floor), count in cells.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_updated_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('vegetable', 'Vegetable'), ('fruit', 'Fruit'), ('seed', 'Seed'), ('dairy', 'Dairy'), ('other', 'Other')], max_length=50)),
+                ('price_floor', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category', 'price_floor'), name='catalog_facet_cell')],
+            },
+        ),
+        migrations.RunPython(count_existing_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:23
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_stock_hold'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_category_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_updated_idx',
+        ),
+    ]
@@ -15,14 +15,113 @@ class Product(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.IntegerField(default=0)
+    # Bumped by every stock write, for compare-and-swap updates, see products.stock
+    version = models.PositiveIntegerField(default=1, editable=False)
     category = models.CharField(max_length=50, choices=CATEGORIES)
     image = models.ImageField(upload_to='product_images/')
+    # Resized WebP/JPEG renditions of image, see products.images
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    
+
+    class Meta:
+        indexes = [
+            # Catalog: category filter with price/date sorts, and the unfiltered sorts
+            models.Index(fields=['category', 'price', 'id'], name='product_category_price_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], name='product_category_created_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['created_at', 'id'], name='product_created_idx'),
+            # Farmer dashboard listing
+            models.Index(fields=['user', '-created_at'], name='product_user_created_idx'),
+            # Home feed: newest in-stock products
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(stock__gt=0), name='product_in_stock_idx'),
+            # Reference counting of content-addressed image blobs
+            models.Index(fields=['image'], name='product_image_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+
+class CatalogFacet(models.Model):
+    """How many products are in one category and price bucket, see products.facets."""
+    category = models.CharField(max_length=50, choices=Product.CATEGORIES)
+    price_floor = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'price_floor'], name='catalog_facet_cell'),
+        ]
+
+    def __str__(self):
+        return f'{self.category} from {self.price_floor}: {self.count}'
+
 def cart_view(request):
     order = Order.objects.filter(user=request.user, status='cart').first()
-    return render(request, 'payment/cart.html', {'order': order})
\ No newline at end of file
+    return render(request, 'payment/cart.html', {'order': order})
+
+class StockMovement(models.Model):
+    """One change to a product's stock and why, see products.stock. Never updated."""
+    REASONS = (
+        ('sale', 'Sale'),
+        ('cancellation', 'Cancellation'),
+        ('restock', 'Restock'),
+        ('edit', 'Manual edit'),
+        # Stock changed outside the ledger (admin, bulk loads), found by compaction
+        ('correction', 'Correction'),
+    )
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=REASONS)
+    order = models.ForeignKey('payment.Order', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # A product's history, and the movements after its last snapshot
+            models.Index(fields=['product', 'id'], name='stock_movement_product_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id}: {self.delta:+d} ({self.reason})'
+
+
+class StockSnapshot(models.Model):
+    """A product's stock after every movement up to ``through_movement``, written by compaction."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    stock = models.IntegerField()
+    # Highest StockMovement id folded in; 0 for the opening balance
+    through_movement = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', '-through_movement'], name='stock_snapshot_latest_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id}: {self.stock} through movement {self.through_movement}'
+
+
+class StockHold(models.Model):
+    """Units of a product reserved for one cart until ``expires_at``, see products.holds."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='holds')
+    order = models.ForeignKey('payment.Order', on_delete=models.CASCADE, related_name='stock_holds')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='stock_hold_order_product'),
+        ]
+        indexes = [
+            # Units held per product: a range scan that never touches the table
+            models.Index(fields=['product', 'expires_at', 'quantity', 'order'], name='stock_hold_active_idx'),
+            # The expiry sweeper
+            models.Index(fields=['expires_at'], name='stock_hold_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product_id} for order {self.order_id} until {self.expires_at}'
@@ -0,0 +1,127 @@
+"""Whole-page cache for the public catalog pages.
+
+The home and catalog pages only differ between viewers by auth state and
+role (the navbar), so one rendered copy per
+(URL, anonymous|customer) is stored in the shared cache and served without
+running the view. Farmers, requests with pending flash messages and anything
+but a plain 200 GET are never cached.
+
+Entries are keyed on a generation number; ``purge_page_cache()`` bumps it on
+every product write, which orphans all stored pages at once. Product detail
+is not cached: it shows what carts leave available, and stock holds come and
+go (and expire) without a product write.
+"""
+import hashlib
+import re
+import time
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+CACHED_URL_NAMES = {'home', 'products', 'view_products'}
+GENERATION_KEY = 'page-cache:generation'
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'Vary')
+
+# Stored pages carry a placeholder instead of the first visitor's CSRF token
+CSRF_INPUT = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+CSRF_PLACEHOLDER = b'__page_cache_csrf_token__'
+
+
+def _fresh_generation():
+    # Restart from the clock if the counter was evicted, so no earlier value comes back
+    return time.time_ns() // 1000
+
+
+def _bump_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, _fresh_generation(), None)
+
+
+def page_generation():
+    """Counter bumped by every product write; see ``purge_page_cache``."""
+    return cache.get_or_set(GENERATION_KEY, _fresh_generation, None)
+
+
+def purge_page_cache():
+    """Drop every cached page, now and again once the current transaction commits."""
+    _bump_generation()
+    # The second bump covers pages re-cached from pre-commit data in between
+    transaction.on_commit(_bump_generation)
+
+
+def _variant(request):
+    """'anonymous' or 'customer', or None when the page must not be cached."""
+    # Read from the session only, so a cache hit needs no user (or any other) query
+    if SESSION_KEY not in request.session:
+        return 'anonymous'
+    if request.session.get('user_role') == 'customer':
+        return 'customer'
+    return None
+
+
+def _cache_key(request, variant):
+    generation = page_generation()
+    url = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+    return f'page-cache:{generation}:{variant}:{url}'
+
+
+def _is_cacheable(request):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    try:
+        if resolve(request.path_info).url_name not in CACHED_URL_NAMES:
+            return False
+    except Resolver404:
+        return False
+    return not len(messages.get_messages(request))
+
+
+class PageCacheMiddleware:
+    """Serve and store the public catalog pages; must come after MessageMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', 300)
+
+    def __call__(self, request):
+        variant = _variant(request) if _is_cacheable(request) else None
+        if variant is None:
+            return self.get_response(request)
+
+        key = _cache_key(request, variant)
+        stored = cache.get(key)
+        if stored is not None:
+            return self._from_cache(request, stored)
+
+        response = self.get_response(request)
+        if response.status_code == 200 and not response.streaming and not len(messages.get_messages(request)):
+            cache.set(key, {
+                'content': CSRF_INPUT.sub(rb'\1' + CSRF_PLACEHOLDER + rb'\2', response.content),
+                'headers': {name: response[name] for name in KEPT_HEADERS if response.has_header(name)},
+            }, self.timeout)
+        return response
+
+    def _from_cache(self, request, stored):
+        content = stored['content']
+        if CSRF_PLACEHOLDER in content:
+            content = content.replace(CSRF_PLACEHOLDER, get_token(request).encode())
+        response = HttpResponse(content)
+        for name, value in stored['headers'].items():
+            response[name] = value
+        # Repeat visitors still get a 304 from the validators the view set
+        return get_conditional_response(
+            request,
+            etag=response.get('ETag'),
+            last_modified=parse_http_date_safe(response.get('Last-Modified')),
+            response=response,
+        )
@@ -0,0 +1,154 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal
+from functools import cached_property
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class CursorPage:
+    """One window of a keyset-paginated queryset.
+
+    Mirrors the parts of Django's ``Page`` the templates use, but never runs a
+    ``COUNT(*)``: the total is only computed if ``total_count`` is accessed.
+    """
+
+    def __init__(self, object_list, queryset, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self._queryset = queryset
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @cached_property
+    def total_count(self):
+        return self._queryset.count()
+
+
+class CursorPaginator:
+    """Paginate a queryset by seeking past the last row seen instead of OFFSET.
+
+    ``ordering`` is a sequence of field names (``-`` prefix for descending) that
+    must end with a unique column, e.g. ``('-created_at', '-id')``. Cursors are
+    opaque url-safe tokens that encode the boundary row's ordering values.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self._fields = [
+            (name.lstrip('-'), name.startswith('-')) for name in self.ordering
+        ]
+
+    def encode_cursor(self, obj, direction):
+        values = [_encode_value(getattr(obj, name)) for name, _ in self._fields]
+        raw = json.dumps([direction, values], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (binascii.Error, ValueError, TypeError):
+            raise InvalidCursor(cursor)
+        if direction not in ('n', 'p') or not isinstance(values, list) or len(values) != len(self._fields):
+            raise InvalidCursor(cursor)
+        return direction, [self._to_python(name, value) for (name, _), value in zip(self._fields, values)]
+
+    def _to_python(self, name, value):
+        try:
+            field = self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Annotated sort keys (e.g. search rank) are stored as plain JSON.
+            if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+                raise InvalidCursor(value)
+            return value
+        try:
+            return field.to_python(value)
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor(value)
+
+    def _seek(self, values, forward):
+        """Build the WHERE clause selecting rows strictly after (or before) ``values``."""
+        condition = Q()
+        for i, (name, descending) in enumerate(self._fields):
+            lookup = 'lt' if descending == forward else 'gt'
+            clause = Q(**{f'{name}__{lookup}': values[i]})
+            for j, (prev_name, _) in enumerate(self._fields[:i]):
+                clause &= Q(**{prev_name: values[j]})
+            condition |= clause
+        return condition
+
+    def page(self, cursor=None, strict=False):
+        """Return the page after/before ``cursor``, or the first page if it is empty.
+
+        An invalid cursor also gives the first page, or raises InvalidCursor if ``strict``.
+        """
+        direction, values = 'n', None
+        if cursor:
+            try:
+                direction, values = self.decode_cursor(cursor)
+            except InvalidCursor:
+                if strict:
+                    raise
+                direction, values = 'n', None
+
+        forward = direction == 'n'
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward))
+        if forward:
+            queryset = queryset.order_by(*self.ordering)
+        else:
+            queryset = queryset.order_by(*[
+                name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering
+            ])
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if forward:
+                if has_more:
+                    next_cursor = self.encode_cursor(rows[-1], 'n')
+                if values is not None:
+                    previous_cursor = self.encode_cursor(rows[0], 'p')
+            else:
+                next_cursor = self.encode_cursor(rows[-1], 'n')
+                if has_more:
+                    previous_cursor = self.encode_cursor(rows[0], 'p')
+        return CursorPage(rows, self.queryset, next_cursor, previous_cursor)
@@ -0,0 +1,114 @@
+"""Full-text product search backed by an SQLite FTS5 index.
+
+``products_product_fts`` is an external-content FTS5 table over
+``Product.name`` and ``Product.description``. Triggers on ``products_product``
+keep it in sync on every insert, update and delete (including ``bulk_create``
+and queryset updates). Other database backends fall back to ``icontains``.
+"""
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'products_product_fts'
+
+# Name matches weigh more than description matches in bm25 ranking
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+INSTALL_STATEMENTS = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description,
+        content='products_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+]
+
+UNINSTALL_STATEMENTS = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def search_index_available(using='default'):
+    return connections[using].vendor == 'sqlite'
+
+
+def install_search_index(using='default'):
+    """Create the FTS table and its sync triggers if they are missing.
+
+    SQLite drops triggers whenever Django remakes ``products_product`` during a
+    migration, so this is also run after every ``migrate``.
+    """
+    if not search_index_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        for statement in INSTALL_STATEMENTS:
+            cursor.execute(statement)
+
+
+def uninstall_search_index(using='default'):
+    if not search_index_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        for statement in UNINSTALL_STATEMENTS:
+            cursor.execute(statement)
+
+
+def rebuild_search_index(using='default'):
+    """Re-read every product row into the index in one bulk pass."""
+    install_search_index(using)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+
+def build_match_expression(query):
+    """Turn free text into an FTS5 query: every word must match as a prefix.
+
+    The text is only split on whitespace; each term is quoted and left to the
+    unicode61 tokenizer, which keeps combining marks (such as Devanagari vowel
+    signs) inside the word they belong to.
+    """
+    terms = query.split()
+    return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+
+def search_products(queryset, query):
+    """Filter ``queryset`` to products matching ``query``, annotated with ``search_rank``.
+
+    Lower ranks are more relevant (bm25 scores are negative in FTS5).
+    """
+    expression = build_match_expression(query)
+    if not expression or not search_index_available(queryset.db):
+        return queryset.filter(
+            Q(name__icontains=query) | Q(description__icontains=query)
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    return queryset.filter(
+        id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression])
+    ).annotate(search_rank=RawSQL(
+        f"SELECT bm25({FTS_TABLE}, %s, %s) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND rowid = products_product.id",
+        [NAME_WEIGHT, DESCRIPTION_WEIGHT, expression],
+        output_field=FloatField(),
+    ))
@@ -0,0 +1,105 @@
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from jobs.queue import enqueue
+from . import ledger
+from .facets import record_product_change
+from .images import derivatives_are_current, generate_derivatives
+from .models import Product
+from .pagecache import purge_page_cache
+
+
+# What the catalog facets depend on: the cell a product counts in, and what searches match
+FACET_FIELDS = ('category', 'price', 'name', 'description')
+
+# {% cache %} fragments in the templates that render one product, keyed on (id, updated_at)
+CARD_FRAGMENTS = ('product_card', 'product_thumb')
+
+
+def invalidate_product_cards(product_id, updated_at):
+    """Drop a product's cached card fragments for the given ``updated_at``.
+
+    Saves move ``updated_at`` on, so the new version is never served from the
+    old key anyway; this just frees the space instead of waiting for the TTL.
+    """
+    if updated_at is not None:
+        cache.delete_many([make_template_fragment_key(name, [product_id, updated_at]) for name in CARD_FRAGMENTS])
+
+
+def refresh_image_derivatives(product, force=False):
+    """Regenerate the product's image derivatives if its image changed (or ``force``)."""
+    if not product.image or (derivatives_are_current(product) and not force):
+        return
+    derivatives = None
+    if not force:
+        # Identical uploads share one blob, so reuse derivatives another product already has
+        shared = (
+            Product.objects.filter(image=product.image.name).exclude(pk=product.pk)
+            .values_list('image_derivatives', flat=True).first()
+        )
+        if shared and shared.get('source') == product.image.name:
+            derivatives = shared
+    if derivatives is None:
+        derivatives = generate_derivatives(product.image)
+    # Queryset update: no save() recursion, but bump updated_at since the rendered image changed
+    Product.objects.filter(pk=product.pk).update(image_derivatives=derivatives, updated_at=timezone.now())
+    product.image_derivatives = derivatives
+    purge_page_cache()
+
+
+def _release_later(name, derivatives):
+    # The job row commits with the save/delete, so a rolled-back change never deletes files
+    enqueue('products.jobs.release_product_image', name=name, derivatives=derivatives)
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_state(sender, instance, raw=False, update_fields=None, **kwargs):
+    # auto_now has not run yet, so this is still the timestamp the cached cards were keyed on
+    instance._previous_updated_at = instance.__dict__.get('updated_at')
+    instance._previous_image = instance._previous_facet = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not set(FACET_FIELDS + ('image',)) & set(update_fields):
+        return
+    previous = Product.objects.filter(pk=instance.pk).values('image', 'image_derivatives', *FACET_FIELDS).first()
+    if previous is None:
+        return
+    if update_fields is None or 'image' in update_fields:
+        instance._previous_image = previous
+    instance._previous_facet = previous
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    purge_page_cache()
+    if created:
+        record_product_change(new=(instance.category, instance.price))
+        ledger.record('restock', {instance.pk: instance.stock})
+    else:
+        invalidate_product_cards(instance.pk, instance._previous_updated_at)
+        previous = instance._previous_facet
+        if previous is not None:
+            record_product_change(
+                (previous['category'], previous['price']), (instance.category, instance.price),
+                text_changed=(previous['name'], previous['description']) != (instance.name, instance.description),
+            )
+    if instance.image and not derivatives_are_current(instance):
+        # Resizing is slow for large uploads; the page shows the original until it's done
+        enqueue('products.jobs.refresh_product_image_derivatives', unique=True, product_id=instance.pk)
+    previous = getattr(instance, '_previous_image', None)
+    if previous and previous['image'] and previous['image'] != instance.image.name:
+        _release_later(previous['image'], previous['image_derivatives'])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    purge_page_cache()
+    record_product_change(old=(instance.category, instance.price))
+    invalidate_product_cards(instance.pk, instance.__dict__.get('updated_at'))
+    if instance.image:
+        _release_later(instance.image.name, instance.image_derivatives)
@@ -0,0 +1,179 @@
+"""Every write to ``Product.stock`` goes through here.
+
+Each one also bumps ``Product.version``, so anyone holding an older copy of
+the row can tell it changed. Two kinds of writes:
+
+* deltas from checkout and cancellation (``take_stock``/``return_stock``):
+  one guarded ``UPDATE ... SET stock = stock - n WHERE stock - held >= n``
+  per call, ``held`` being what other carts reserved (``products.holds``).
+  The guard is the compare, so concurrent checkouts never lose an update and
+  never need a retry;
+* absolute values from the farmer's edit form (``set_stock``): a
+  compare-and-swap on the version the form was rendered with. If the row
+  moved on meanwhile, the farmer's change is replayed on top of the new
+  stock and tried again, up to ``STOCK_UPDATE_ATTEMPTS`` times by
+  ``retry_on_conflict``.
+
+Each write also appends to the stock ledger, see ``products.ledger``.
+Attempts, conflicts and shortfalls (checkouts refused for lack of stock) are
+counted per operation in the cache, see ``conflict_metrics`` and
+``manage.py stock_metrics``. Successful attempts are counted once their
+transaction commits, so the cache is never written while the database write
+lock is held on the hot path; failures are rare and counted at once, as
+their transaction usually rolls back.
+"""
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from . import holds, ledger
+from .models import Product
+
+METRIC_EVENTS = ('attempts', 'conflicts', 'shortfalls', 'exhausted')
+METRICS_KEY = 'stock:metrics:{operation}:{event}'
+# Operations recorded so far, so metrics can be listed without a key scan
+OPERATIONS_KEY = 'stock:metrics:operations'
+RETRY_BACKOFF = 0.005  # seconds, times the attempt number, jittered
+
+
+class StockConflict(Exception):
+    """The row changed between reading and writing it."""
+
+
+def _count(operation, event):
+    key = METRICS_KEY.format(operation=operation, event=event)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+        operations = cache.get(OPERATIONS_KEY, set())
+        if operation not in operations:
+            cache.set(OPERATIONS_KEY, operations | {operation}, None)
+
+
+def record_attempt(operation, failure=None):
+    """Count one attempt at ``operation`` and, if it failed, its ``failure`` event."""
+    if failure is None:
+        transaction.on_commit(lambda: _count(operation, 'attempts'))
+        return
+    _count(operation, 'attempts')
+    _count(operation, failure)
+
+
+def conflict_metrics():
+    """{operation: {attempts, conflicts, shortfalls, exhausted, conflict_rate}} since the cache was last cleared."""
+    metrics = {}
+    for operation in sorted(cache.get(OPERATIONS_KEY, set())):
+        keys = {event: METRICS_KEY.format(operation=operation, event=event) for event in METRIC_EVENTS}
+        values = cache.get_many(keys.values())
+        counts = {event: values.get(key, 0) for event, key in keys.items()}
+        counts['conflict_rate'] = round(counts['conflicts'] / counts['attempts'], 4) if counts['attempts'] else 0.0
+        metrics[operation] = counts
+    return metrics
+
+
+def retry_on_conflict(operation, name, attempts=None):
+    """Call ``operation()`` until it stops raising StockConflict, at most ``attempts`` times.
+
+    The last StockConflict is re-raised once the attempts run out.
+    """
+    attempts = attempts or getattr(settings, 'STOCK_UPDATE_ATTEMPTS', 3)
+    for attempt in range(1, attempts + 1):
+        try:
+            result = operation()
+        except StockConflict:
+            record_attempt(name, 'conflicts')
+            if attempt == attempts:
+                _count(name, 'exhausted')
+                raise
+            time.sleep(random.uniform(0, RETRY_BACKOFF * attempt))
+        else:
+            record_attempt(name)
+            return result
+
+
+def _per_product(quantities):
+    return Case(
+        *[When(id=product_id, then=Value(qty)) for product_id, qty in quantities.items()],
+        output_field=models.IntegerField(),
+    )
+
+
+def take_stock(requested, order=None):
+    """Decrement stock by {product id: quantity} for ``order``, all or nothing.
+
+    Units other carts hold are not for sale; the order's own holds become the
+    sale and are dropped. Returns {} on success. Otherwise nothing was written
+    and the result maps the short products to what was available to sell.
+    Call inside a transaction.
+    """
+    quantity = _per_product(requested)
+    updated = (
+        Product.objects.filter(id__in=requested)
+        .alias(held=holds.held_by_others(order))
+        .filter(stock__gte=F('held') + quantity)
+        .update(stock=F('stock') - quantity, version=F('version') + 1, updated_at=timezone.now())
+    )
+    if updated == len(requested):
+        record_attempt('checkout')
+        ledger.record('sale', {product_id: -qty for product_id, qty in requested.items()}, order)
+        if order is not None:
+            holds.release(order)
+        return {}
+    # Not a conflict: the guard refused to sell stock that is not there
+    record_attempt('checkout', 'shortfalls')
+    available = holds.available_to_sell(requested, order)
+    short = {
+        product_id: max(available.get(product_id, 0), 0) for product_id, qty in requested.items()
+        if qty > available.get(product_id, 0)
+    }
+    # Freed up since the UPDATE: still report something, nothing was taken
+    return short or {product_id: max(available.get(product_id, 0), 0) for product_id in requested}
+
+
+def return_stock(returned, order=None):
+    """Increment stock by {product id: quantity} for a cancelled ``order``."""
+    if not returned:
+        return
+    with transaction.atomic():
+        Product.objects.filter(id__in=returned).update(
+            stock=F('stock') + _per_product(returned), version=F('version') + 1, updated_at=timezone.now(),
+        )
+        ledger.record('cancellation', returned, order)
+
+
+def compare_and_swap(product_id, version, **values):
+    """Write ``values`` if the row is still at ``version``; raises StockConflict otherwise."""
+    updated = Product.objects.filter(id=product_id, version=version).update(
+        version=F('version') + 1, updated_at=timezone.now(), **values,
+    )
+    if not updated:
+        raise StockConflict(product_id)
+
+
+def set_stock(product_id, stock, seen_stock=None, seen_version=None):
+    """Set a product's stock to what the farmer typed, returning the stock written.
+
+    ``seen_stock``/``seen_version`` are what the edit form was rendered with.
+    If the row changed since, the farmer's adjustment (``stock - seen_stock``)
+    is applied to the current stock instead, so units sold in between are not
+    put back on sale. Without them the value is written as is. The ledger
+    delta is always taken from the row, never from the form. Call inside a
+    transaction.
+    """
+    def attempt():
+        current = Product.objects.filter(id=product_id).values('stock', 'version').get()
+        previous, version = current['stock'], current['version']
+        target = stock
+        if seen_version is not None and seen_stock is not None and version != seen_version:
+            target = max(previous + stock - seen_stock, 0)
+        compare_and_swap(product_id, version, stock=target)
+        ledger.record('restock' if target > previous else 'edit', {product_id: target - previous})
+        return target
+
+    return retry_on_conflict(attempt, 'edit_product')
@@ -0,0 +1,74 @@
+"""Content-addressed media storage.
+
+Files are named after the SHA-256 digest of their bytes, so uploading the same
+image twice stores one blob that both products point at. A blob is referenced
+by every ``Product`` row whose ``image`` holds its name; ``release_image``
+deletes it once that count drops to zero, along with those of its derivatives
+no other product lists in ``image_derivatives``.
+"""
+import hashlib
+import os
+import posixpath
+import re
+from functools import reduce
+from operator import or_
+
+from django.core.files.storage import FileSystemStorage
+from django.db.models import Q
+
+CONTENT_ADDRESSED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def content_digest(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks() if hasattr(content, 'chunks') else iter(lambda: content.read(65536), b''):
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def is_content_addressed(name):
+    return bool(CONTENT_ADDRESSED_NAME.search(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that stores each distinct file once, under ``<dir>/<aa>/<sha256>.<ext>``."""
+
+    def content_name(self, name, content):
+        directory, filename = posixpath.split(name)
+        digest = content_digest(content)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def _save(self, name, content):
+        hashed = self.content_name(name, content)
+        if self.exists(hashed):
+            return hashed
+        # Write under a unique temporary name, then atomically move it into place so a
+        # concurrent upload of the same bytes can never see a partially written blob.
+        directory, filename = posixpath.split(hashed)
+        temporary = super()._save(self.get_available_name(posixpath.join(directory, f'.incoming-{filename}')), content)
+        os.replace(self.path(temporary), self.path(hashed))
+        return hashed
+
+
+def release_image(storage, name, derivatives):
+    """Delete an image blob no product references any more, and its unshared derivatives."""
+    from .images import derivative_names
+    from .models import Product
+
+    if not name or Product.objects.filter(image=name).exists():
+        return False
+    storage.delete(name)
+    unshared = set(derivative_names(derivatives))
+    if unshared:
+        # Different uploads can render to identical derivative blobs
+        sharing = Product.objects.filter(reduce(or_, [Q(image_derivatives__icontains=n) for n in unshared]))
+        for other in sharing.values_list('image_derivatives', flat=True):
+            unshared.difference_update(derivative_names(other))
+    for derivative in unshared:
+        storage.delete(derivative)
+    return True
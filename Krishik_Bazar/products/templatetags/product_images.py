@@ -0,0 +1,36 @@
+from django import template
+from django.utils.html import format_html
+
+from products.images import srcset
+
+register = template.Library()
+
+# How wide each derivative kind is rendered, for the browser to pick a srcset candidate
+SIZES = {
+    'thumb': '64px',
+    'card': '(min-width: 1024px) 33vw, (min-width: 640px) 50vw, 100vw',
+    'detail': '(min-width: 768px) 50vw, 100vw',
+}
+
+
+@register.simple_tag
+def product_picture(product, kind, css_class=''):
+    """
+    Renders a <picture> with WebP and JPEG srcsets for the product image,
+    or a plain <img> of the original upload if derivatives are not ready yet.
+    """
+    if not product.image:
+        return ''
+    loading = 'eager' if kind == 'detail' else 'lazy'
+    webp = srcset(product, kind, 'webp')
+    jpeg = srcset(product, kind, 'jpeg')
+    if not jpeg:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}">',
+            product.image.url, product.name, css_class, loading,
+        )
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="{}"></picture>',
+        webp, SIZES[kind], jpeg.split(' ', 1)[0], jpeg, SIZES[kind], product.name, css_class, loading,
+    )
@@ -2,11 +2,33 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponseForbidden
+from django.db import transaction
+from django.db.models import F
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+from .cards import as_cards
+from .facets import catalog_facets, facet_generation
+from .holds import HoldRefused, held_by_others, reserve
+from .pagecache import page_generation
 from .models import Product
 from payment.models import Order, OrderItem  # Import from payment app
 from functools import wraps
+import hashlib
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Q
+from .pagination import CursorPaginator
+from .stock import StockConflict, set_stock
+from .search import search_products
+
+PRODUCTS_PER_PAGE = 12
+
+# Keyset orderings for each sort option; 'id' breaks ties so cursors are unique.
+SORT_ORDERINGS = {
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+    'date_asc': ('created_at', 'id'),
+    'date_desc': ('-created_at', '-id'),
+    'relevance': ('search_rank', 'id'),
+}
 
 def farmer_required(view_func):
     @wraps(view_func)
@@ -20,6 +42,40 @@ def farmer_required(view_func):
         return view_func(request, *args, **kwargs)
     return _wrapped_view
 
+def _page_etag(request, *validators):
+    """ETag for a page built from ``validators`` plus who is looking at it, or None to skip."""
+    # Flash messages render once, so a page carrying them must never be answered with a 304
+    if len(messages.get_messages(request)):
+        return None
+    # Pages differ between viewers only in the navbar, which depends on auth state and role
+    viewer = request.user.role if request.user.is_authenticated else 'anonymous'
+    return hashlib.sha1('|'.join(map(str, validators + (viewer,))).encode()).hexdigest()
+
+def conditional_page(etag_func, last_modified_func=None):
+    """
+    condition() plus Cache-Control telling browsers and the CDN to revalidate
+    every time, so unchanged pages come back as a cheap 304 instead of a render.
+    """
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if request.user.is_authenticated:
+                # The navbar depends on the user's role; shared caches must not keep it
+                patch_cache_control(response, private=True, no_cache=True)
+            else:
+                patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return _wrapped_view
+    return decorator
+
+def _farmer_products(request):
+    # The current farmer's products; the edit form is prefilled from the full description
+    return as_cards(Product.objects.filter(user=request.user).order_by('-created_at'), with_description=True)
+
 @farmer_required
 def add_product(request):
     if request.method == 'POST':
@@ -33,14 +89,14 @@ def add_product(request):
         # Basic validation
         if not all([name, description, price_str, stock_str, category]):
             messages.error(request, "All fields are required.")
-            return render(request, 'add_product.html', {'user': request.user, 'farmer_products': Product.objects.filter(user=request.user).order_by('-created_at')})
+            return render(request, 'add_product.html', {'user': request.user, 'farmer_products': _farmer_products(request)})
 
         try:
             price = float(price_str)
             stock = int(stock_str)
         except (ValueError, TypeError):
             messages.error(request, "Price and stock must be valid numbers.")
-            return render(request, 'add_product.html', {'user': request.user, 'farmer_products': Product.objects.filter(user=request.user).order_by('-created_at')})
+            return render(request, 'add_product.html', {'user': request.user, 'farmer_products': _farmer_products(request)})
 
         # Create and save the new product
         new_product = Product.objects.create(
@@ -56,12 +112,9 @@ def add_product(request):
         messages.success(request, f"Product '{new_product.name}' added successfully!")
         return redirect('add_product')
     
-    # Retrieve and display products for the current farmer
-    farmer_products = Product.objects.filter(user=request.user).order_by('-created_at')
-    
     context = {
         'user': request.user,
-        'farmer_products': farmer_products,
+        'farmer_products': _farmer_products(request),
     }
     return render(request, 'add_product.html', context)
 
@@ -94,16 +147,31 @@ def edit_product(request):
             messages.error(request, "Price and stock must be valid numbers.")
             return redirect('add_product')
 
-        # Update product
+        try:
+            seen_stock = int(request.POST['seen_stock'])
+            seen_version = int(request.POST['seen_version'])
+        except (KeyError, ValueError):
+            seen_stock = seen_version = None  # an old form: write the stock as typed
+
+        # Update product. Stock is written by compare-and-swap, the rest by save()
         product.name = name
         product.description = description
         product.price = price
-        product.stock = stock
         product.category = category
+        fields = ['name', 'description', 'price', 'category', 'updated_at']
         if image:
             product.image = image
-        product.save()
+            fields.append('image')
+        try:
+            with transaction.atomic():
+                product.stock = set_stock(product.id, stock, seen_stock, seen_version)
+                product.save(update_fields=fields)
+        except StockConflict:
+            messages.error(request, f"'{product.name}' is selling right now and could not be updated. Please try again.")
+            return redirect('add_product')
 
+        if product.stock != stock:
+            messages.info(request, f"Stock is now {product.stock}, to account for orders placed while you were editing.")
         messages.success(request, f"Product '{product.name}' updated successfully!")
         return redirect('add_product')
 
@@ -123,54 +191,75 @@ def delete_product(request, product_id):
     
     return redirect('add_product')
 
-def view_products(request):
+def _catalog_query(request):
     # Start with all products
     products = Product.objects.all()
     
     # 1. Handle Filtering and Searching
     search_query = request.GET.get('q')
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) | Q(description__icontains=search_query)
-        )
+        products = search_products(products, search_query)
     
     category_filter = request.GET.get('category')
     if category_filter:
         products = products.filter(category=category_filter)
         
     # 2. Handle Sorting
-    sort_by = request.GET.get('sort', 'date_desc') # Default to newest first
-    if sort_by == 'price_asc':
-        products = products.order_by('price')
-    elif sort_by == 'price_desc':
-        products = products.order_by('-price')
-    elif sort_by == 'date_asc':
-        products = products.order_by('created_at')
-    else: # 'date_desc'
-        products = products.order_by('-created_at')
+    # Searches default to best match first, browsing to newest first
+    sort_by = request.GET.get('sort') or ('relevance' if search_query else 'date_desc')
+    if sort_by == 'relevance' and not search_query:
+        sort_by = 'date_desc'
+    return products, search_query, category_filter, sort_by
+
+def catalog_etag(request):
+    # Every product write bumps the page generation, so no query is needed to
+    # tell whether any listing (or its facet counts) could have changed
+    return _page_etag(request, page_generation(), facet_generation(), sorted(request.GET.lists()))
+
+@conditional_page(catalog_etag)
+def view_products(request):
+    products, search_query, category_filter, sort_by = _catalog_query(request)
+    products = as_cards(products)
+    ordering = SORT_ORDERINGS.get(sort_by, SORT_ORDERINGS['date_desc'])
 
     # 3. Handle Pagination
-    paginator = Paginator(products, 12) # Show 12 products per page
-    page_number = request.GET.get('page', 1)
-    
-    try:
-        paginated_products = paginator.page(page_number)
-    except PageNotAnInteger:
-        paginated_products = paginator.page(1)
-    except EmptyPage:
-        paginated_products = paginator.page(paginator.num_pages)
+    page_number = request.GET.get('page')
+    if page_number is not None:
+        # Legacy numbered pages (COUNT + OFFSET), kept so old links keep working
+        paginator = Paginator(products.order_by(*ordering), PRODUCTS_PER_PAGE)
+        try:
+            paginated_products = paginator.page(page_number)
+        except PageNotAnInteger:
+            paginated_products = paginator.page(1)
+        except EmptyPage:
+            paginated_products = paginator.page(paginator.num_pages)
+    else:
+        # Cursor pages seek past the last row seen, so deep pages cost the same as the first
+        paginator = CursorPaginator(products, ordering, PRODUCTS_PER_PAGE)
+        paginated_products = paginator.page(request.GET.get('cursor'))
 
     context = {
         'products': paginated_products, # Pass the paginated list to the template
         'search_query': search_query,
         'category_filter': category_filter,
         'sort_by': sort_by,
+        'facets': catalog_facets(search_query, category_filter),
     }
 
     return render(request, 'products.html', context)
 
+def _with_available(products):
+    # Stock less what carts hold; only that much can still go into a cart
+    return products.annotate(available=F('stock') - held_by_others())
+
+def product_etag(request, product_id):
+    # No Last-Modified: holds change availability without touching updated_at
+    row = _with_available(Product.objects.filter(id=product_id)).values_list('updated_at', 'available').first()
+    return _page_etag(request, product_id, *row) if row else None
+
+@conditional_page(product_etag)
 def product_detail(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
+    product = get_object_or_404(_with_available(Product.objects.all()), id=product_id)
     context = {
         'product': product,
     }
@@ -181,30 +270,30 @@ def add_to_cart(request, product_id):
     product = get_object_or_404(Product, id=product_id)
     quantity = int(request.POST.get('quantity', 1))
 
-    if quantity > product.stock:
-        messages.error(request, f"Only {product.stock} items available in stock.")
-        return redirect('product_detail', product_id=product.id)
-
     # Get or create a pending order (cart) for the user
     order, created = Order.objects.get_or_create(
         user=request.user,
         status='cart'  # Assuming 'cart' is a status for pending orders
     )
-
     # Check if the product is already in the cart
-    order_item, created = OrderItem.objects.get_or_create(
-        order=order,
-        product=product,
-        defaults={'quantity': quantity, 'price': product.price}
-    )
+    order_item = OrderItem.objects.filter(order=order, product=product).first()
+    in_cart = order_item.quantity if order_item else 0
 
-    if not created:
-        # Update quantity if item already exists
-        if order_item.quantity + quantity > product.stock:
-            messages.error(request, f"Cannot add {quantity} more. Only {product.stock - order_item.quantity} left in stock.")
-            return redirect('product_detail', product_id=product.id)
-        order_item.quantity += quantity
-        order_item.save()
+    # Reserve the line's new total for this cart, then record it
+    try:
+        with transaction.atomic():
+            reserve(order, product.id, in_cart + quantity)
+            if order_item:
+                order_item.quantity += quantity
+                order_item.save()
+            else:
+                OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+    except HoldRefused as exc:
+        if in_cart:
+            messages.error(request, f"Cannot add {quantity} more. Only {max(exc.available - in_cart, 0)} left in stock.")
+        else:
+            messages.error(request, f"Only {exc.available} items available in stock.")
+        return redirect('product_detail', product_id=product.id)
 
     messages.success(request, f"{quantity} x {product.name} added to cart.")
     return redirect('payment:cart')  # Corrected redirect
\ No newline at end of file
@@ -1,3 +1,106 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, modify_settings
+from django.urls import reverse
 
-# Create your tests here.
+from perf.testing import QueryBudgetMixin
+from products.models import Product
+from .models import User
+from .views import HOME_FEED_SIZE
+
+
+@modify_settings(MIDDLEWARE={'remove': 'products.pagecache.PageCacheMiddleware'})
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every user view stays within a fixed number of queries however big the catalog is."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = User.objects.create_user(username='farmer', email='farmer@example.com', password='pw', role='farmer')
+        cls.customer = User.objects.create_user(username='customer', email='customer@example.com', password='pw')
+
+    def setUp(self):
+        cache.clear()
+
+    def assertFlat(self, budget, request):
+        for size in (3, 30):
+            for i in range(Product.objects.count(), size):
+                Product.objects.create(
+                    user=self.farmer, name=f'Tomato {i}', description='Fresh', price=10, stock=5,
+                    category='vegetable', image='product_images/tomato.jpg',
+                )
+            with self.subTest(products=size), self.assertQueryBudget(budget, f'{size} products'):
+                response = request()
+            self.assertLess(response.status_code, 400)
+
+    def test_home(self):
+        self.assertFlat(1, lambda: self.client.get(reverse('home')))
+        self.assertFlat(1, lambda: self.client.get(reverse('home_feed')))
+
+    def test_login_and_logout(self):
+        self.assertFlat(0, lambda: self.client.get(reverse('login')))
+        self.assertFlat(10, lambda: self.client.post(reverse('login'), {'email': 'customer@example.com', 'password': 'pw'}))
+        self.assertFlat(3, lambda: self.client.get(reverse('logout')))
+
+    def test_register(self):
+        self.assertFlat(0, lambda: self.client.get(reverse('register')))
+        emails = iter(['new1@example.com', 'new2@example.com'])
+
+        def register():
+            email = next(emails)
+            return self.client.post(reverse('register'), {
+                'username': email.split('@')[0], 'email': email, 'password': 'pw', 'role': 'customer',
+            })
+        self.assertFlat(3, register)
+
+    def test_profile(self):
+        self.client.force_login(self.customer)
+        self.assertFlat(1, lambda: self.client.get(reverse('profile')))
+        self.assertFlat(7, lambda: self.client.post(reverse('profile_update'), {
+            'username': 'customer', 'email': 'customer@example.com', 'role': 'customer',
+        }))
+
+    def test_home_cards_render_pictures_from_the_feed_query(self):
+        # The card template reads image_derivatives and updated_at; both must come with the feed
+        derivatives = {'source': 'product_images/tomato.jpg', 'card': {
+            'webp': [['product_images/derivatives/card.webp', 320]], 'jpeg': [['product_images/derivatives/card.jpeg', 320]],
+        }}
+        for i in range(5):
+            Product.objects.create(
+                user=self.farmer, name=f'Tomato {i}', description='Fresh', price=10, stock=5,
+                category='vegetable', image='product_images/tomato.jpg', image_derivatives=derivatives,
+            )
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'srcset="/media/product_images/derivatives/card.webp 320w"', count=5)
+
+
+class HomeFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        farmer = User.objects.create_user(username='farmer', email='farmer@example.com', password='pw', role='farmer')
+        for i in range(HOME_FEED_SIZE * 2 + 3):
+            Product.objects.create(
+                user=farmer, name=f'Tomato {i}', description='Fresh', price=10, stock=0 if i % 5 == 0 else 5,
+                category='vegetable', image='product_images/tomato.jpg',
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursors_walk_every_in_stock_product_newest_first(self):
+        response = self.client.get(reverse('home'))
+        seen = [product.id for product in response.context['products']]
+        cursor = response.context['next_cursor']
+        while cursor:
+            response = self.client.get(reverse('home_feed'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            seen += [product.id for product in response.context['products']]
+            cursor = response.get('X-Next-Cursor')
+
+        expected = Product.objects.filter(stock__gt=0).order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, list(expected))
+        self.assertEqual(len(response.context['products']), len(expected) % HOME_FEED_SIZE)
+
+    def test_invalid_cursor_is_rejected(self):
+        for cursor in ('garbage', 'WyJuIiwgWzFdXQ'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(reverse('home_feed'), {'cursor': cursor}).status_code, 400)
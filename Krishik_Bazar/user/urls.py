@@ -7,4 +7,5 @@ urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('profile/update/', views.profile_update, name='profile_update'),
     path('', views.home, name='home'),
+    path('feed/', views.home_feed, name='home_feed'),
 ]
\ No newline at end of file
@@ -1,4 +1,5 @@
 from django.shortcuts import render, redirect
+from django.http import HttpResponseBadRequest
 from django.contrib import messages
 from .forms import UserRegisterForm
 from django.contrib.auth import authenticate, login, logout
@@ -7,6 +8,11 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import update_session_auth_hash
 from django.shortcuts import get_object_or_404
 from products.models import Product
+from products.cards import as_cards
+from products.pagination import CursorPaginator, InvalidCursor
+
+HOME_FEED_SIZE = 8
+
 # Registration with hashed password
 def register(request):
     if request.method == 'POST':
@@ -66,10 +72,27 @@ def login_view(request):
 
     return render(request, 'login.html')
 
+def _home_feed_page(cursor=None):
+    # Newest in-stock products, one fixed-size window at a time
+    products = as_cards(Product.objects.filter(stock__gt=0))
+    return CursorPaginator(products, ('-created_at', '-id'), HOME_FEED_SIZE).page(cursor, strict=True)
+
 # Home view
 def home(request):
-    products = Product.objects.all()  # fetch all products
-    return render(request, 'home.html', {"products": products})
+    page = _home_feed_page()
+    return render(request, 'home.html', {"products": page, "next_cursor": page.next_cursor})
+
+# "Load more" continuation for the home feed, returns just the cards
+def home_feed(request):
+    try:
+        page = _home_feed_page(request.GET.get('cursor'))
+    except InvalidCursor:
+        # Starting over would append the first cards again below the ones shown
+        return HttpResponseBadRequest("Invalid cursor.")
+    response = render(request, 'partials/home_product_cards.html', {"products": page})
+    if page.next_cursor:
+        response['X-Next-Cursor'] = page.next_cursor
+    return response
 # Logout view
 def logout_view(request):
     logout(request)
@@ -118,6 +141,8 @@ def profile_update(request):
             update_session_auth_hash(request, user)
 
         user.save()
+        # The page cache picks the navbar variant from this, see products/pagecache.py
+        request.session['user_role'] = user.role
         messages.success(request, "Profile updated successfully.")
         
     return redirect('profile')